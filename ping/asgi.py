@@ -0,0 +1,17 @@
+"""
+ASGI config for ping project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The handler is tournament.asgi.ASGIHandler, see there what it adds to Django's.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from tournament.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ping.settings')
+
+application = get_asgi_application()
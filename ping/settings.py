@@ -42,20 +42,24 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tournament.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tournament.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tournament.middleware.CurrentTournamentMiddleware',
 ]
 
 ROOT_URLCONF = 'ping.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django templates which report the rendering time in the Server-Timing header
+        'BACKEND': 'tournament.profiling.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')]
         ,
         'APP_DIRS': True,
@@ -76,14 +80,72 @@ WSGI_APPLICATION = 'ping.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# SQLite with WAL, write transactions started with BEGIN IMMEDIATE (tournament/backends/sqlite3)
+# and a busy timeout: concurrent writers wait for each other instead of failing with "database is locked".
+# Tests use a file too, in-memory databases cannot be shared by threads.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'tournament.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
 
+# Rendered pages are shared by all threads and worker processes
+# https://docs.djangoproject.com/en/2.1/topics/cache/#filesystem-caching
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
+# Queries of every request as JSON, over-budget requests as warnings (see tournament.querystats)
+# https://docs.djangoproject.com/en/2.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'require_debug_true': {
+            '()': 'django.utils.log.RequireDebugTrue',
+        },
+        'require_debug_false': {
+            '()': 'django.utils.log.RequireDebugFalse',
+        },
+    },
+    'handlers': {
+        'queries': {
+            'class': 'logging.StreamHandler',
+            'filters': ['require_debug_true'],
+        },
+        'queries_over_budget': {
+            'class': 'logging.StreamHandler',
+            'level': 'WARNING',
+            'filters': ['require_debug_false'],
+        },
+    },
+    'loggers': {
+        'tournament.queries': {
+            'handlers': ['queries', 'queries_over_budget'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -120,5 +182,18 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
-STATIC_ROOT = 'static'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATIC_URL = '/static/'
+# collectstatic writes content-hashed names and .gz files for nginx (see ping/nginx.linux.conf)
+STATICFILES_STORAGE = 'tournament.storage.CompressedManifestStaticFilesStorage'
+
+# Generated .xlsx schedules
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+# Business days of the group stage and of the date validation (see tournament.businessdays); Monday is 0
+BUSINESS_WEEKEND = (5, 6)
+HOLIDAYS_FILE = os.path.join(BASE_DIR, 'tournament', 'data', 'holidays_ru.txt')
+
+# Profiles of the requests made by staff with ?profile=1, downloadable from the admin
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_KEEP = 50
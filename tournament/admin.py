@@ -1,9 +1,90 @@
-from django.contrib import admin
-from .models import Tournament, Participant, Game, SetResult
+import io
+import os
+import pstats
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError, PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Tournament, Participant, Game, SetResult, DrawJob
+from .functions import run_draw
+from .results import import_results, FORMATS
+from .profiling import list_profiles, profile_path
+
+
+class ImportResultsForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSONL, one game per row")
+    dry_run = forms.BooleanField(required=False, initial=True, help_text="only validate the file")
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        self.cleaned_data['format'] = os.path.splitext(file.name)[1].lstrip('.').lower()
+        if self.cleaned_data['format'] not in FORMATS:
+            raise ValidationError("Upload a .csv or a .jsonl file")
+        try:
+            return file.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValidationError("The file must be in UTF-8")
+
+
+class TournamentAdmin(admin.ModelAdmin):
+    actions = ['draw_numbers']
+
+    def draw_numbers(self, request, queryset):
+        for tournament in queryset:
+            try:
+                run_draw(tournament)
+            except ValidationError as e:
+                self.message_user(request, "{}: {}".format(tournament, " ".join(e.messages)), messages.ERROR)
+            else:
+                self.message_user(request, "{}: drawn numbers are assigned".format(tournament))
+    draw_numbers.short_description = "Assign random drawn numbers to all participants"
+
+    def get_urls(self):
+        return [
+            path('<int:tournament_id>/import_results/', self.admin_site.admin_view(self.import_results_view),
+                 name='tournament_tournament_import_results'),
+            path('profiles/', self.admin_site.admin_view(self.profiles_view), name='tournament_profiles'),
+            path('profiles/<str:name>', self.admin_site.admin_view(self.profile_view), name='tournament_profile'),
+        ] + super().get_urls()
+
+    def import_results_view(self, request, tournament_id):
+        tournament = get_object_or_404(Tournament, pk=tournament_id)
+        if not self.has_change_permission(request, tournament):
+            raise PermissionDenied
+        report = dry_run = None
+        form = ImportResultsForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            report = import_results(tournament, form.cleaned_data['file'], form.cleaned_data['format'], dry_run)
+        context = dict(self.admin_site.each_context(request), title="Import results", tournament=tournament,
+                       form=form, report=report, dry_run=dry_run)
+        return TemplateResponse(request, 'admin/tournament/tournament/import_results.html', context)
+
+    def profiles_view(self, request):
+        """Profiles saved by ProfilingMiddleware"""
+        context = dict(self.admin_site.each_context(request), title="Request profiles", profiles=list_profiles())
+        return TemplateResponse(request, 'admin/tournament/tournament/profiles.html', context)
+
+    def profile_view(self, request, name):
+        """The .prof file (for snakeviz, pstats...) or, with ?stats, the functions with the most cumulative time"""
+        try:
+            path = profile_path(name)
+            if 'stats' not in request.GET:
+                return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+            stream = io.StringIO()
+            pstats.Stats(path, stream=stream).sort_stats('cumulative').print_stats(50)
+        except FileNotFoundError:
+            raise Http404("No such profile")
+        context = dict(self.admin_site.each_context(request), title=name, stats=stream.getvalue())
+        return TemplateResponse(request, 'admin/tournament/tournament/profile_stats.html', context)
 
 
 # Register your models here.
-admin.site.register(Tournament)
+admin.site.register(Tournament, TournamentAdmin)
 admin.site.register(Participant)
 admin.site.register(Game)
 admin.site.register(SetResult)
+admin.site.register(DrawJob)
@@ -0,0 +1,135 @@
+from functools import wraps
+from django.core.paginator import Paginator, EmptyPage
+from django.db.models import Q, F, Case, When, Value, CharField
+from django.db.models.functions import Concat
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_safe
+from tournament.models import Game
+from tournament.caching import cached_api, get_data_version
+from tournament.querystats import query_budget
+
+STATUSES = {
+    0: 'registration',
+    1: 'draw',
+    2: 'group_stage',
+    3: 'playoff',
+    4: 'finished',
+}
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+GAME_FIELDS = ('id', 'game_id', 'game_date', 'start_time', 'participant1', 'participant2', 'participant1_name',
+               'participant2_name', 'sets1', 'sets2', 'points1', 'points2', 'winner', 'is_played')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def api_view(view):
+    """A read-only endpoint of the current tournament: JSON errors, ETag and Cache-Control."""
+    @require_safe
+    @wraps(view)
+    def tournament_view(request, *args, **kwargs):
+        if request.tournament is None:
+            return json_response({'error': "There are no tournaments"}, status=404)
+        try:
+            return json_response(view(request, request.tournament, *args, **kwargs))
+        except BadRequest as e:
+            return json_response({'error': str(e)}, status=400)
+    return cached_api(tournament_view)
+
+
+def int_param(request, name, default=None, minimum=1, maximum=None):
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest("'{}' must be an integer".format(name))
+    if value < minimum:
+        raise BadRequest("'{}' must be at least {}".format(name, minimum))
+    if maximum is not None and value > maximum:
+        raise BadRequest("'{}' must be at most {}".format(name, maximum))
+    return value
+
+
+def full_name(side):
+    # Concat() turns NULL into '', play-off slots without a participant must stay null
+    return Case(When(**{side + '__isnull': True}, then=Value(None)),
+                default=Concat(F(side + '__user__first_name'), Value(' '), F(side + '__user__last_name')),
+                output_field=CharField())
+
+
+def games_values(games):
+    return games.annotate(participant1_name=full_name('participant1'),
+                          participant2_name=full_name('participant2')).values(*GAME_FIELDS)
+
+
+@query_budget(3)
+@api_view
+def status(request, tournament):
+    status = tournament.get_status()
+    data_version, data_updated = get_data_version(request)
+    return {
+        'id': tournament.pk,
+        'status': STATUSES[status],
+        'status_code': status,
+        'reg_end': tournament.reg_end,
+        'start_date': tournament.start_date,
+        'start_date_playoff': tournament.start_date_playoff,
+        'end_date': tournament.end_date,
+        'participants': tournament.number_of_participants(),
+        'data_version': data_version,
+        'data_updated': data_updated,
+    }
+
+
+@query_budget(4)
+@api_view
+def schedule(request, tournament):
+    """Games ordered by time; ?day=YYYY-MM-DD, ?participant=<id>, ?page=, ?page_size="""
+    games = tournament.game_set.order_by('game_date', 'start_time', 'game_id', 'pk')
+    day = request.GET.get('day')
+    if day is not None:
+        try:
+            day = parse_date(day)
+        except ValueError:
+            day = None
+        if day is None:
+            raise BadRequest("'day' must be a date in YYYY-MM-DD format")
+        games = games.filter(game_date=day)
+    participant = int_param(request, 'participant')
+    if participant is not None:
+        games = games.filter(Q(participant1=participant) | Q(participant2=participant))
+
+    paginator = Paginator(games_values(games), int_param(request, 'page_size', PAGE_SIZE, maximum=MAX_PAGE_SIZE))
+    try:
+        page = paginator.page(int_param(request, 'page', 1))
+    except EmptyPage:
+        raise BadRequest("'page' must be between 1 and {}".format(paginator.num_pages))
+    return {
+        'count': paginator.count,
+        'page': page.number,
+        'pages': paginator.num_pages,
+        'games': list(page),
+    }
+
+
+@query_budget(3)
+@api_view
+def standings(request, tournament):
+    return {'standings': [dict(row, place=place) for place, row in enumerate(tournament.standings(), 1)]}
+
+
+@query_budget(3)
+@api_view
+def bracket(request, tournament):
+    games = games_values(tournament.game_set.exclude(game_id=0).order_by('game_id'))
+    names = dict(Game.game_ids)
+    return {'games': [dict(game, stage=names[game['game_id']]) for game in games]}
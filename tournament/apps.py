@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TournamentConfig(AppConfig):
     name = 'tournament'
+
+    def ready(self):
+        from tournament import signals
@@ -0,0 +1,125 @@
+import asyncio
+from contextvars import ContextVar
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers import asgi
+from django.http import StreamingHttpResponse
+from django.urls import Resolver404, resolve
+
+# receive() of the connection being served, to notice the client going away in the middle of a stream
+current_receive = ContextVar('receive')
+
+
+def shared_thread(view):
+    """
+    Marks an async view whose sync code runs in Django's one shared thread rather than in a thread of the request's
+    own: the views of long requests that hardly touch the database, like the event streams.
+    """
+    view.shared_thread = True
+    return view
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    StreamingHttpResponse with an async iterator as content: the stream waits on the event loop, not in a thread.
+    Only ASGIHandler below can send it; Django 3.2 iterates streaming responses synchronously.
+    """
+
+    def _set_streaming_content(self, value):
+        self._iterator = value.__aiter__()
+
+    async def __aiter__(self):
+        async for part in self._iterator:
+            yield self.make_bytes(part)
+
+    def __iter__(self):
+        raise TypeError("{} can only be sent by tournament.asgi.ASGIHandler".format(self.__class__.__name__))
+
+    async def aclose(self):
+        if hasattr(self._iterator, 'aclose'):
+            await self._iterator.aclose()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django's ASGIHandler which
+    - runs the sync code of every request (sync_to_async) in a thread of its own: in Django 3.2 all requests share
+      one thread, so a slow query of one request would hold up the others. Not for @shared_thread views: a thread
+      and a database connection for every open stream would be too many;
+    - sends AsyncStreamingHttpResponse and stops the stream as soon as the client disconnects.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = current_receive.set(receive)
+        try:
+            if self.is_shared_thread(scope):
+                await super().__call__(scope, receive, send)
+            else:
+                async with ThreadSensitiveContext():
+                    await super().__call__(scope, receive, send)
+        finally:
+            current_receive.reset(token)
+
+    def is_shared_thread(self, scope):
+        if scope['type'] != 'http':
+            return False
+        script_name = self.get_script_prefix(scope).rstrip('/')
+        path = scope['path']
+        try:
+            match = resolve(path[len(script_name):] if script_name and path.startswith(script_name) else path)
+        except Resolver404:
+            return False
+        return getattr(match.func, 'shared_thread', False)
+
+    async def send_response(self, response, send):
+        if not isinstance(response, AsyncStreamingHttpResponse):
+            return await super().send_response(response, send)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        stream = asyncio.ensure_future(self.stream(response, send))
+        disconnect = asyncio.ensure_future(self.wait_for_disconnect(current_receive.get()))
+        try:
+            await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stream.cancel()
+            disconnect.cancel()
+            # The stream must be stopped before its iterator is closed
+            error = (await asyncio.gather(stream, disconnect, return_exceptions=True))[0]
+            await response.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
+        if isinstance(error, Exception):
+            raise error
+
+    async def stream(self, response, send):
+        async for part in response:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def response_headers(response):
+        # As in ASGIHandler.send_response(): keep the case of the headers, add the cookies
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        return headers
+
+
+def get_asgi_application():
+    """django.core.asgi.get_asgi_application() with the ASGIHandler above."""
+    django.setup(set_prefix=False)
+    return ASGIHandler()
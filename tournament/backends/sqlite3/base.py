@@ -0,0 +1,29 @@
+from django.db.backends.sqlite3 import base
+
+# Applied to every new connection. WAL lets the pages read while results are written;
+# NORMAL is durable in WAL mode except for the last transactions on a power loss.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+    # Negative: in KiB, 20 MB
+    ('cache_size', '-20000'),
+)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite for several threads and processes writing at once (see ping/settings.py).
+    The busy timeout is the 'timeout' option of the database.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in PRAGMAS:
+            conn.execute('PRAGMA {} = {}'.format(pragma, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred transaction which reads first fails at once with "database is locked" when it writes
+        # after another writer, without waiting for the busy timeout: take the write lock at the start.
+        self.cursor().execute("BEGIN IMMEDIATE")
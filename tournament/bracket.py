@@ -0,0 +1,63 @@
+from django.db.models import Case, When, Value, IntegerField
+from tournament.models import Game
+
+# Play-off game_id -> (game_id, field) of the slot its winner or loser advances to
+WINNER_ADVANCES = {
+    1: (5, 'participant1'),
+    4: (5, 'participant2'),
+    2: (6, 'participant1'),
+    3: (6, 'participant2'),
+    5: (8, 'participant1'),
+    6: (8, 'participant2'),
+}
+LOSER_ADVANCES = {
+    5: (7, 'participant1'),
+    6: (7, 'participant2'),
+}
+QUARTER_FINALS = (1, 2, 3, 4)
+
+
+def seed_quarter_finals(tournament):
+    """
+    Put the current top 8 of the group stage rating into the quarter finals.
+    Does nothing once any quarter final has a result.
+    The rating is the one kept on Participant (see tournament.standings): it is read in the write transaction
+    of every group stage result, where a recount would hold the database write lock for long.
+    """
+    quarter_finals = tournament.game_set.filter(game_id__in=QUARTER_FINALS)
+    if quarter_finals.filter(is_played=True).exists():
+        return
+    seeds = list(tournament.participant_set.order_by('-win_sets', '-win_balls', 'pk').values_list('pk', flat=True)[:8])
+    if len(seeds) < 8:
+        return
+    # Quarter final #i is played by the i-th and the (9-i)-th places
+    quarter_finals.update(
+        participant1=Case(*[When(game_id=i, then=Value(seeds[i - 1])) for i in QUARTER_FINALS],
+                          output_field=IntegerField()),
+        participant2=Case(*[When(game_id=i, then=Value(seeds[8 - i])) for i in QUARTER_FINALS],
+                          output_field=IntegerField()),
+    )
+
+
+def propagate(game):
+    """
+    Advance the winner and the loser of a play-off game into the dependent games (or clear their slots).
+    A dependent game which is already played passes its new participant on in turn: after a corrected result
+    the results of the later games stay, and their winner is whoever now has the winning slot.
+    """
+    game = Game.objects.select_related('participant1', 'participant2').get(pk=game.pk)
+    for advances, participant in ((WINNER_ADVANCES, game.get_winner()), (LOSER_ADVANCES, game.get_loser())):
+        if game.game_id in advances:
+            game_id, field = advances[game.game_id]
+            dependent = Game.objects.filter(tournament=game.tournament_id, game_id=game_id)
+            dependent.update(**{field: participant})
+            played = dependent.filter(is_played=True).first()
+            if played is not None:
+                propagate(played)
+
+
+def game_results_changed(game):
+    if game.game_id == 0:
+        seed_quarter_finals(game.tournament)
+    else:
+        propagate(game)
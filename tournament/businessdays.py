@@ -0,0 +1,103 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+from functools import lru_cache
+from django.conf import settings
+
+# Years to which the MM-DD lines of a holidays file are applied
+FIRST_YEAR = 2000
+LAST_YEAR = 2100
+
+
+def load_holidays(path, years=range(FIRST_YEAR, LAST_YEAR + 1)):
+    """
+    Dates of a holidays file: one date a line, MM-DD for every year or YYYY-MM-DD for one year,
+    # starts a comment.
+    """
+    holidays = set()
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                if line.count('-') == 1:
+                    month, day = map(int, line.split('-'))
+                    holidays.update(date(year, month, day) for year in years if month != 2 or day != 29)
+                else:
+                    holidays.add(date.fromisoformat(line))
+            except ValueError:
+                raise ValueError("{}, line {}: {!r} is not a date".format(path, number, line))
+    return holidays
+
+
+class BusinessCalendar:
+    """
+    Business days: the days of the week which are not `weekend` (Monday is 0) and not in `holidays`.
+    Weeks are counted arithmetically and holidays by binary search, so the cost does not depend
+    on how many days apart the dates are.
+    """
+
+    def __init__(self, weekend=(5, 6), holidays=()):
+        self.workdays = [weekday for weekday in range(7) if weekday not in weekend]
+        if not self.workdays:
+            raise ValueError("A week must have at least one business day")
+        # before[weekday]: number of workdays of a week before the weekday
+        self.before = [sum(1 for workday in self.workdays if workday < weekday) for weekday in range(7)]
+        # Only holidays on workdays change anything; kept as sorted ordinals
+        self.holidays = sorted(day.toordinal() for day in set(holidays) if day.weekday() in self.workdays)
+
+    def _workdays_before(self, ordinal):
+        # date.fromordinal(1) is a Monday
+        weeks, weekday = divmod(ordinal - 1, 7)
+        return weeks * len(self.workdays) + self.before[weekday]
+
+    def _workday(self, index):
+        # Ordinal of the workday with _workdays_before() == index
+        weeks, position = divmod(index, len(self.workdays))
+        return 1 + weeks * 7 + self.workdays[position]
+
+    def index(self, day):
+        """Number of business days before the day, since the beginning of the calendar."""
+        ordinal = day.toordinal()
+        return self._workdays_before(ordinal) - bisect_left(self.holidays, ordinal)
+
+    def nth(self, index):
+        """The business day with the given index()."""
+        skipped = 0
+        while True:
+            ordinal = self._workday(index + skipped)
+            holidays = bisect_right(self.holidays, ordinal)
+            if holidays == skipped:
+                return date.fromordinal(ordinal)
+            skipped = holidays
+
+    def is_business_day(self, day):
+        ordinal = day.toordinal()
+        position = bisect_left(self.holidays, ordinal)
+        return day.weekday() in self.workdays and (position == len(self.holidays) or
+                                                   self.holidays[position] != ordinal)
+
+    def add(self, day, days):
+        """
+        The `days`-th business day after the day (before it if negative), like pandas' day + BDay(days).
+        With 0: the day itself if it is a business day, the next business day otherwise.
+        """
+        if days > 0 and self.is_business_day(day):
+            return self.nth(self.index(day) + days)
+        return self.nth(self.index(day) + days - (days > 0))
+
+    def count(self, start, end):
+        """Number of business days from start to end, end excluded."""
+        return max(self.index(end) - self.index(start), 0)
+
+    def business_days(self, start, end):
+        """Business days from start to end, end excluded."""
+        first = self.index(start)
+        return [self.nth(index) for index in range(first, first + self.count(start, end))]
+
+
+@lru_cache(maxsize=None)
+def get_calendar():
+    """The calendar of the settings BUSINESS_WEEKEND and HOLIDAYS_FILE, loaded on first use."""
+    holidays = load_holidays(settings.HOLIDAYS_FILE) if settings.HOLIDAYS_FILE else ()
+    return BusinessCalendar(settings.BUSINESS_WEEKEND, holidays)
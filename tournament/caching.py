@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+from calendar import timegm
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from tournament.models import Tournament
+
+# Old versions of responses are never requested again and just expire
+RESPONSE_TIMEOUT = 24 * 60 * 60
+API_MAX_AGE = 10
+
+
+def bump_data_version(tournament_id):
+    """Invalidate the cached pages of the tournament (an id or a subquery): called whenever its data changes."""
+    Tournament.objects.filter(pk=tournament_id).update(data_version=F('data_version') + 1,
+                                                       data_updated=timezone.now())
+
+
+def get_data_version(request):
+    """(data_version, data_updated) of request.tournament, read from the database once per request."""
+    if not hasattr(request, '_data_version'):
+        row = None
+        if request.tournament:
+            row = Tournament.objects.filter(pk=request.tournament.pk).values_list('data_version',
+                                                                                  'data_updated').first()
+        request._data_version = row or (0, None)
+    return request._data_version
+
+
+def data_version_key(request, per_user=True):
+    """Everything a response depends on: the data, the tournament stage, the URL and the user shown in the menu."""
+    version, updated = get_data_version(request)
+    tournament = request.tournament
+    user = request.user.pk if per_user and request.user.is_authenticated else 0
+    return "{}:{}:{}:{}:{}:{}".format(tournament.pk if tournament else 0, version,
+                                      updated.timestamp() if updated else 0,
+                                      tournament.get_status() if tournament else 5,
+                                      user, request.get_full_path())
+
+
+def page_etag(request, *args, **kwargs):
+    return hashlib.sha1(data_version_key(request).encode()).hexdigest()
+
+
+def api_etag(request, *args, **kwargs):
+    return hashlib.sha1(data_version_key(request, per_user=False).encode()).hexdigest()
+
+
+def last_modified(request, *args, **kwargs):
+    return get_data_version(request)[1]
+
+
+def revalidate(request, etag_func):
+    """
+    (cache key, ETag, Last-Modified timestamp, response) of a request to a cached view. The response is
+    304 Not Modified or 412 Precondition Failed for conditional requests, the cached one or None.
+    """
+    key = etag_func(request)
+    etag = quote_etag(key)
+    updated = last_modified(request)
+    modified = timegm(updated.utctimetuple()) if updated else None
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None and request.method in ('GET', 'HEAD'):
+        cached = cache.get('response:' + key)
+        if cached is not None:
+            response = HttpResponse(cached[0], content_type=cached[1])
+    return key, etag, modified, response
+
+
+def store(request, key, response):
+    if request.method in ('GET', 'HEAD') and response.status_code == 200 and not response.streaming:
+        cache.set('response:' + key, (response.content, response['Content-Type']), RESPONSE_TIMEOUT)
+
+
+def cached_response(etag_func, vary=(), **cache_control):
+    """
+    Cache the response under the data version of the tournament (in the cache shared by all workers)
+    and answer conditional GETs with 304 Not Modified. Works for sync and async views.
+    """
+    def finish(request, response, etag, modified):
+        # What django.views.decorators.http.condition does, which has no async version
+        if request.method in ('GET', 'HEAD'):
+            if modified and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(modified)
+            response.headers.setdefault('ETag', etag)
+        patch_cache_control(response, **cache_control)
+        patch_vary_headers(response, vary)
+        return response
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_cached_view(request, *args, **kwargs):
+                key, etag, modified, response = await sync_to_async(revalidate)(request, etag_func)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    await sync_to_async(store)(request, key, response)
+                return finish(request, response, etag, modified)
+            return async_cached_view
+
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            key, etag, modified, response = revalidate(request, etag_func)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                store(request, key, response)
+            return finish(request, response, etag, modified)
+        return cached_view
+    return decorator
+
+
+# Pages show the user in the menu; browsers and nginx must ask every time, which is cheap thanks to the ETag
+cached_page = cached_response(page_etag, vary=('Cookie',), private=True, no_cache=True)
+# API clients poll, a few seconds of staleness are fine
+cached_api = cached_response(api_etag, public=True, max_age=API_MAX_AGE)
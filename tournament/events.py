@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import json
+from datetime import timedelta
+from time import monotonic, sleep
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from tournament.models import Participant, Game, SetResult, ResultEvent
+
+# Events are only needed by the pages which are open right now
+EVENT_RETENTION = timedelta(hours=6)
+POLL_INTERVAL = 1
+KEEP_ALIVE_INTERVAL = 15
+# Under WSGI a stream holds a server thread (waitress has --threads of them, see ping/nginx.conf):
+# it is closed after this time and the browser reconnects with Last-Event-ID
+STREAM_DURATION = 60
+RECONNECT_DELAY_MS = 1000
+EVENTS_PER_POLL = 100
+
+
+def publish_game_results(game_id):
+    """
+    Write the current score of the game and the standings of its participants to the outbox.
+    Called by tournament.signals in the transaction which changed the results.
+    """
+    game = Game.objects.filter(pk=game_id).values('pk', 'tournament', 'game_id', 'participant1', 'participant2',
+                                                  'sets1', 'sets2', 'points1', 'points2', 'winner',
+                                                  'is_played').first()
+    if game is None:
+        return None
+    sets = SetResult.objects.filter(game=game_id).order_by('set_number').values_list('result1', 'result2')
+    standings = Participant.objects.filter(pk__in=(game['participant1'], game['participant2'])).order_by('pk')
+    payload = {
+        'game': dict(game, sets=list(sets)),
+        'standings': list(standings.values('pk', 'win_sets', 'win_balls', 'games_left')),
+    }
+    ResultEvent.objects.filter(created__lt=timezone.now() - EVENT_RETENTION).delete()
+    return ResultEvent.objects.create(tournament_id=game['tournament'], game_id=game_id,
+                                      payload=json.dumps(payload, separators=(',', ':')))
+
+
+def last_event_id(tournament):
+    return ResultEvent.objects.filter(tournament=tournament).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def new_events(tournament, after):
+    """Committed events after the given id; only the latest event of each game is kept."""
+    events = list(ResultEvent.objects.filter(tournament=tournament, pk__gt=after).order_by('pk')
+                  .values_list('pk', 'game', 'payload')[:EVENTS_PER_POLL])
+    latest = {game: (pk, payload) for pk, game, payload in events}
+    return sorted(latest.values()), events[-1][0] if events else after
+
+
+def event_message(pk, payload):
+    return "id: {}\nevent: result\ndata: {}\n\n".format(pk, payload)
+
+
+def event_stream(tournament, after):
+    """Server-Sent Events of the result changes of the tournament, polled from the outbox."""
+    yield "retry: {}\n\n".format(RECONNECT_DELAY_MS)
+    deadline = monotonic() + STREAM_DURATION
+    keep_alive = monotonic() + KEEP_ALIVE_INTERVAL
+    while monotonic() < deadline:
+        events, after = new_events(tournament, after)
+        for pk, payload in events:
+            yield event_message(pk, payload)
+        if events:
+            keep_alive = monotonic() + KEEP_ALIVE_INTERVAL
+        elif monotonic() > keep_alive:
+            yield ": keep-alive\n\n"
+            keep_alive = monotonic() + KEEP_ALIVE_INTERVAL
+        sleep(POLL_INTERVAL)
+
+
+def events_after(after):
+    """Committed events of all tournaments after the given id, for EventHub."""
+    return list(ResultEvent.objects.filter(pk__gt=after).order_by('pk')
+                .values_list('pk', 'tournament', 'game', 'payload')[:EVENTS_PER_POLL])
+
+
+class EventHub:
+    """
+    The one poller of the async streams of a process: while any stream is open it reads the new events of all
+    tournaments with one query a POLL_INTERVAL and puts them into the queues of the streams of their tournament.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.after = 0
+        self.task = None
+
+    def subscribe(self, tournament, after):
+        """Queue of the lists of (id, payload) of the events of the tournament; the events up to `after` are known."""
+        queue = asyncio.Queue()
+        self.queues.setdefault(tournament, set()).add(queue)
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.after = after
+            # Not in the context of the request which happens to start it
+            self.task = contextvars.Context().run(asyncio.ensure_future, self.poll())
+        return queue
+
+    def unsubscribe(self, tournament, queue):
+        queues = self.queues.get(tournament, set())
+        queues.discard(queue)
+        if not queues:
+            self.queues.pop(tournament, None)
+
+    async def poll(self):
+        fetch = sync_to_async(events_after)
+        while self.queues:
+            events = await fetch(self.after)
+            latest = {}
+            for pk, tournament, game, payload in events:
+                latest.setdefault(tournament, {})[game] = (pk, payload)
+                self.after = pk
+            for tournament, games in latest.items():
+                for queue in self.queues.get(tournament, ()):
+                    queue.put_nowait(sorted(games.values()))
+            # Catching up: the next batch at once
+            if len(events) < EVENTS_PER_POLL:
+                await asyncio.sleep(POLL_INTERVAL)
+
+
+hub = EventHub()
+
+
+async def async_event_stream(tournament, after):
+    """event_stream() for ASGI: the stream waits on the event loop for the events EventHub hands it."""
+    yield "retry: {}\n\n".format(RECONNECT_DELAY_MS)
+    queue = hub.subscribe(tournament, after)
+    try:
+        # The events before the stream subscribed, once; the queue may repeat some of them
+        poll = sync_to_async(new_events)
+        while True:
+            events, last = await poll(tournament, after)
+            for pk, payload in events:
+                yield event_message(pk, payload)
+            if last == after:
+                break
+            after = last
+        deadline = monotonic() + STREAM_DURATION
+        while monotonic() < deadline:
+            try:
+                events = await asyncio.wait_for(queue.get(), min(KEEP_ALIVE_INTERVAL, deadline - monotonic()))
+            except asyncio.TimeoutError:
+                if monotonic() < deadline:
+                    yield ": keep-alive\n\n"
+                continue
+            for pk, payload in events:
+                if pk > after:
+                    yield event_message(pk, payload)
+                    after = pk
+    finally:
+        hub.unsubscribe(tournament, queue)
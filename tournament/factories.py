@@ -0,0 +1,61 @@
+import random
+from datetime import timedelta, time
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from tournament.models import Tournament, Participant, SetResult
+from tournament.results import results_added
+from tournament.functions import run_draw, generate_games, generate_schedule, generate_playoff_games, save_draw
+
+
+def random_set(rng):
+    """A valid random set score: 11 to 0..9, or 12:10, 13:11, ... after 10:10."""
+    loser = rng.randint(0, 14)
+    winner = 11 if loser < 10 else loser + 2
+    return (winner, loser) if rng.random() < 0.5 else (loser, winner)
+
+
+def create_tournament(number_of_participants, played=0.5, games_per_person=4, seed=1, **fields):
+    """
+    A tournament at the group stage with N participants and a drawn and scheduled group stage,
+    `played` of whose games have random valid results. Other fields of the tournament can be given.
+    """
+    now = timezone.now()
+    today = timezone.localdate()
+    # A player has one game a day: games_per_person + 1 rounds, business days, with room to spare
+    group_days = timedelta(days=3 * games_per_person + 7)
+    defaults = dict(reg_end=now - timedelta(days=3), draw_time=now - timedelta(days=2),
+                    start_date=today - timedelta(days=1),
+                    start_date_playoff=today - timedelta(days=1) + group_days,
+                    end_date=today + group_days + timedelta(days=5), games_per_person=games_per_person,
+                    game_duration=timedelta(minutes=30), game_start_time=time(9),
+                    # Half of the players play every day: up to 4 rounds of games a day
+                    number_of_tables=max(4, number_of_participants // 8))
+    defaults.update(fields)
+    rng = random.Random(seed)
+
+    with transaction.atomic():
+        tournament = Tournament.objects.create(**defaults)
+        prefix = 'player{}-'.format(tournament.pk)
+        User.objects.bulk_create([User(username=prefix + str(i), first_name='Name{}'.format(i),
+                                       last_name='Surname{}'.format(i))
+                                  for i in range(number_of_participants)])
+        users = User.objects.filter(username__startswith=prefix).order_by('pk')
+        Participant.objects.bulk_create([Participant(tournament=tournament, user=user) for user in users])
+
+        run_draw(tournament, seed=seed)
+        games = generate_games(seed=seed, tournament=tournament)
+        unplaced = generate_schedule(games, tournament)
+        if unplaced:
+            raise ValueError("{} games could not be scheduled: {}".format(len(unplaced), unplaced[0][1]))
+        save_draw(games + generate_playoff_games(tournament))
+
+        group_games = list(tournament.game_set.filter(game_id=0).order_by('pk'))
+        results = [(game, [random_set(rng) for _ in range(tournament.number_of_sets)])
+                   for game in group_games[:int(len(group_games) * played)]]
+        SetResult.objects.bulk_create([SetResult(game=game, set_number=number, result1=result1, result2=result2)
+                                       for game, sets in results
+                                       for number, (result1, result2) in enumerate(sets, 1)])
+        if results:
+            results_added(tournament, results)
+    return tournament
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+import uuid
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+from tournament.validators import validate_set
 
 
 class RegisterForm(forms.Form):
@@ -39,10 +41,29 @@ class ResultForm(forms.Form):
     set5res1.widget.attrs.update({'style': 'max-width: 40px'})
     set5res2.widget.attrs.update({'style': 'max-width: 40px'})
 
+    # Idempotency key: a repeated submission of the same form is recognized (see results.submit_results)
+    submission = forms.UUIDField(widget=forms.HiddenInput, initial=uuid.uuid4, required=False)
+
+    number_of_sets = 5
+
+    def clean_submission(self):
+        return self.cleaned_data['submission'] or uuid.uuid4()
+
+    def sets(self):
+        """Scores of the filled sets as (result1, result2)"""
+        sets = []
+        for i in range(1, self.number_of_sets + 1):
+            result1 = self.cleaned_data.get('set{}res1'.format(i))
+            result2 = self.cleaned_data.get('set{}res2'.format(i))
+            if result1 is None or result2 is None:
+                break
+            sets.append((result1, result2))
+        return sets
+
     def clean(self):
         cleaned_data = super().clean()
 
-        for i in range(1, 6):
+        for i in range(1, self.number_of_sets + 1):
             f1 = "set{}res1".format(i)
             f2 = "set{}res2".format(i)
             r1 = cleaned_data.get(f1)
@@ -51,26 +72,11 @@ class ResultForm(forms.Form):
             if r1 is None or r2 is None:
                 break
 
-            if r1 > r2:
-                if r1 - r2 > 2:
-                    if r1 != 11:
-                        self.add_error(f1, "Set #{}: Result must be 11".format(i))
-                elif r1 - r2 == 1:
-                    self.add_error(f1, "Set #{}: Point difference must be at least 2".format(i))
-                else:
-                    if r1 < 11:
-                        self.add_error(f1, "Set #{}: Result must be at least 11".format(i))
-            elif r2 > r1:
-                if r2 - r1 > 2:
-                    if r2 != 11:
-                        self.add_error(f1, "Set #{}: Result must be 11".format(i))
-                elif r2 - r1 == 1:
-                    self.add_error(f1, "Set #{}: Point difference must be at least 2".format(i))
-                else:
-                    if r2 < 11:
-                        self.add_error(f1, "Set #{}: Result must be at least 11".format(i))
-            else:
-                self.add_error(f1, ValidationError(_("Set #{}: Results cannot be equal".format(i))))
+            try:
+                validate_set(r1, r2)
+            except ValidationError as e:
+                for message in e.messages:
+                    self.add_error(f1, "Set #{}: {}".format(i, message))
 
         return cleaned_data
 
@@ -90,38 +96,7 @@ class PlayoffResultForm(ResultForm):
     set7res1.widget.attrs.update({'style': 'max-width: 40px'})
     set7res2.widget.attrs.update({'style': 'max-width: 40px'})
 
-    def clean(self):
-        cleaned_data = super().clean()
-
-        for i in range(1, 8):
-            f1 = "set{}res1".format(i)
-            f2 = "set{}res2".format(i)
-            r1 = cleaned_data.get(f1)
-            r2 = cleaned_data.get(f2)
-
-            if r1 is None or r2 is None:
-                break
-
-            if r1 > r2:
-                if r1 - r2 > 2:
-                    if r1 != 11:
-                        self.add_error(f1, "Set #{}: Result must be 11".format(i))
-                elif r1 - r2 == 1:
-                    self.add_error(f1, "Set #{}: Point difference must be at least 2".format(i))
-                else:
-                    if r1 < 11:
-                        self.add_error(f1, "Set #{}: Result must be at least 11".format(i))
-            elif r2 > r1:
-                if r2 - r1 > 2:
-                    if r2 != 11:
-                        self.add_error(f1, "Set #{}: Result must be 11".format(i))
-                elif r2 - r1 == 1:
-                    self.add_error(f1, "Set #{}: Point difference must be at least 2".format(i))
-                else:
-                    if r2 < 11:
-                        self.add_error(f1, "Set #{}: Result must be at least 11".format(i))
-            else:
-                self.add_error(f1, ValidationError(_("Set #{}: Results cannot be equal".format(i))))
+    number_of_sets = 7
 
 
 class UserCreationForm(forms.ModelForm):
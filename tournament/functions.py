@@ -1,249 +1,330 @@
 import sys
 import os
+import hashlib
 from openpyxl import *
 from openpyxl.styles import *
+from openpyxl.cell import WriteOnlyCell
 import datetime
 import random
 from datetime import *
-from time import *
+from time import monotonic
 from itertools import cycle
-from tournament.models import Tournament, Game
+from collections import defaultdict
+from tournament.models import Tournament, Participant, Game, SetResult
+from tournament.caching import bump_data_version
+from tournament.businessdays import get_calendar
 from django.utils import timezone
-from django.db.models import Q
-from ping.settings import BASE_DIR
-
-
-def get_current_tournament():
-    if Tournament.objects.exists():
-        return Tournament.objects.latest('id')
-    return None
-
-
-def get_number_of_rounds(tour):
-    if tour.number_of_participants() % 2 == 0:
-        return tour.games_per_person
-    else:
-        return tour.games_per_person // 2
-
-
-def generate_games_subset(games, participants):
-    tournament = get_current_tournament()
-    random.shuffle(participants)
-    number_of_participants = len(participants)
-    games_subset = []
-
-    for i in range(number_of_participants // 2):
-
-        game = Game(tournament=tournament, id1=participants[i], id2=participants[number_of_participants - i - 1])
-
-        if game not in games:
-            games_subset.append(game)
-
-    return games_subset
-
-
-def number_of_games(games, p_id):
-    number = 0
-    for game in games:
-        if game.id1 == p_id or game.id2 == p_id:
-            number += 1
-    return number
-
-
-def games_per_person(games, participants):
-
-    games_per_person_list = [number_of_games(games, p) for p in participants]
-    return games_per_person_list
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q, Case, When, Value, Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from django.conf import settings
+
+
+# Tournaments are cached by the process and forgotten when a tournament is saved or deleted
+# (see tournament.signals). Other processes notice the change after CURRENT_TOURNAMENT_TTL seconds.
+CURRENT_TOURNAMENT_TTL = 30
+_tournaments = {}
+
+
+def get_tournament(pk=None):
+    """Return a fresh instance of the tournament, of the latest one if pk is None (None if there is no such)."""
+    cached = _tournaments.get(pk)
+    if cached is None or cached[0] < monotonic():
+        queryset = Tournament.objects.order_by('-id') if pk is None else Tournament.objects.filter(pk=pk)
+        tournament = queryset.first()
+        if tournament is None:
+            if pk is not None:
+                return None
+            cached = (monotonic() + CURRENT_TOURNAMENT_TTL, None, None)
+        else:
+            field_names = [f.attname for f in Tournament._meta.concrete_fields]
+            cached = (monotonic() + CURRENT_TOURNAMENT_TTL, field_names,
+                      [getattr(tournament, name) for name in field_names])
+        _tournaments[pk] = cached
 
+    expires, field_names, values = cached
+    if field_names is None:
+        return None
+    return Tournament.from_db(DEFAULT_DB_ALIAS, field_names, values)
 
-def games_number_is_equal(games, participants):
 
-    if len(set(games_per_person(games, participants))) == 1:
-        return True
+def get_current_tournament():
+    return get_tournament()
+
+
+def forget_cached_tournaments():
+    _tournaments.clear()
+
+
+def generate_pairs(number_of_participants, games_per_person, seed=None):
+    """
+    Return drawn number pairs (id1, id2), id1 < id2, in which everybody has exactly the same number of
+    different opponents: games_per_person, capped by the field size and rounded down to even in an odd field.
+    An even field is paired by the circle method, an odd one by a circulant graph split into rounds.
+    The pairs come round after round (nobody plays twice in a round), as many rounds as games in an even field
+    and one more in an odd one. The same seed gives the same pairs; another seed draws other rounds of the circle
+    or other offsets of the circulant, so the opponents change and not only the numbers (except when everybody
+    plays everybody).
+    """
+    n = number_of_participants
+    if n < 2:
+        return []
+    degree = min(games_per_person, n - 1)
+    if n % 2:
+        # n * degree / 2 games are only possible with an even degree
+        degree -= degree % 2
+
+    rnd = random.Random(seed)
+    players = list(range(1, n + 1))
+    rnd.shuffle(players)
+    pairs = []
+
+    if n % 2 == 0:
+        # Player players[n - 1] stays in the centre, the others rotate around the circle
+        rounds = list(range(n - 1))
+        rnd.shuffle(rounds)
+        for r in rounds[:degree]:
+            pairs.append((players[n - 1], players[r]))
+            for k in range(1, n // 2):
+                pairs.append((players[(r + k) % (n - 1)], players[(r - k) % (n - 1)]))
     else:
-        return False
-
-
-def generate_games():
-    tour = get_current_tournament()
-    number_of_rounds = get_number_of_rounds(tour)
-    divider = 2
-    games_number = tour.games_per_person
-    participants = [i for i in range(1, tour.number_of_participants() + 1)]
-
+        # Everybody plays the neighbours degree / 2 drawn distances away on each side
+        for offset in rnd.sample(range(1, n // 2 + 1), degree // 2):
+            for i in range(n):
+                pairs.append((players[i], players[(i + offset) % n]))
+        pairs = [pair for games in split_into_rounds(pairs) for pair in games]
+
+    return [(min(pair), max(pair)) for pair in pairs]
+
+
+def split_into_rounds(pairs):
+    """
+    Split different pairs into rounds in which everybody plays at most once: a proper edge colouring
+    of the graph of the pairs by Misra and Gries' algorithm, with at most (most games of a player + 1) rounds.
+    """
+    def edge(u, v):
+        return (u, v) if u < v else (v, u)
+
+    neighbours = defaultdict(list)
+    for u, v in pairs:
+        neighbours[u].append(v)
+        neighbours[v].append(u)
+    number_of_rounds = max(map(len, neighbours.values()), default=0) + 1
+    colours = {}
+    # Per player: colour -> opponent
+    taken = defaultdict(dict)
+
+    def paint(u, v, colour):
+        colours[edge(u, v)] = colour
+        taken[u][colour] = v
+        taken[v][colour] = u
+
+    def wipe(u, v):
+        colour = colours.pop(edge(u, v))
+        del taken[u][colour]
+        del taken[v][colour]
+        return colour
+
+    def free_colour(u):
+        return next(colour for colour in range(number_of_rounds) if colour not in taken[u])
+
+    def is_fan(u, fan):
+        return all(colours.get(edge(u, w)) is not None and colours[edge(u, w)] not in taken[previous]
+                   for previous, w in zip(fan, fan[1:]))
+
+    for u, v in pairs:
+        # Maximal fan of u: the colour of the edge to each next vertex is free on the previous one
+        fan = [v]
+        extended = True
+        while extended:
+            extended = False
+            for w in neighbours[u]:
+                if w not in fan and is_fan(u, [fan[-1], w]):
+                    fan.append(w)
+                    extended = True
+                    break
+        c, d = free_colour(u), free_colour(fan[-1])
+        # Swap c and d on the path of these colours from u: d becomes free on u
+        path = []
+        x, colour = u, d
+        while colour in taken[x]:
+            path.append((x, taken[x][colour]))
+            x, colour = taken[x][colour], c if colour == d else d
+        swapped = [(x, y, c if wipe(x, y) == d else d) for x, y in path]
+        for x, y, colour in swapped:
+            paint(x, y, colour)
+        end = next(i for i, w in enumerate(fan) if d not in taken[w] and is_fan(u, fan[:i + 1]))
+        # Rotate the fan up to that vertex: its edge is left uncoloured and gets d
+        for previous, w in zip(fan[:end], fan[1:end + 1]):
+            paint(u, previous, wipe(u, w))
+        paint(u, fan[end], d)
+
+    rounds = [[] for _ in range(number_of_rounds)]
+    for pair in pairs:
+        rounds[colours[edge(*pair)]].append(pair)
+    return [games for games in rounds if games]
+
+
+def generate_games(seed=None, tournament=None):
+    tour = tournament or get_current_tournament()
+    pairs = generate_pairs(tour.number_of_participants(), tour.games_per_person, seed)
+    return [Game(tournament=tour, id1=id1, id2=id2) for id1, id2 in pairs]
+
+
+def generate_playoff_games(tournament=None):
+    tournament = tournament or get_current_tournament()
     games = []
-    rounds_counter = 0
-    attempts_number = 50
-    attempt = 0
-    games_per_person_list = [0] * len(participants)
-    step = 1
-
-    while rounds_counter != number_of_rounds:
-
-        # generate possible couples
-        if games_number_is_equal(games, participants):
-            games_subset = generate_games_subset(games, participants)
-        else:
-            min_games = min(games_per_person(games, participants))
-            subset_participants = [p for p in participants if number_of_games(games, p) == min_games]
-
-            if len(subset_participants) < divider:
-                for p in participants:
-                    if p not in subset_participants:
-                        subset_participants.append(p)
-                        if len(subset_participants) == divider:
-                            break
-
-            games_subset = generate_games_subset(games, subset_participants)
-
-        games.extend(games_subset)
-        random.shuffle(participants)
-
-        # exit when everybody has the same number of games
-        if games_number_is_equal(games, participants):
-            rounds_counter += 1
-
-        # start again if impossible to generate unique couples
-        attempt += 1
-        if attempt > attempts_number:
-            participants = [i for i in range(1, tour.number_of_participants() + 1)]
-            games = []
-            rounds_counter = 0
-            attempt = 0
-
-    return games
-
-
-def generate_playoff_games():
-    tournament = get_current_tournament()
 
     for i in range(4):
-        g = Game(tournament=tournament, game_id=i+1, id1=i+1, id2=8-i,
-                 game_date=tournament.start_date_playoff, start_time="1{}:00:00".format(i+2))
-        g.save()
+        games.append(Game(tournament=tournament, game_id=i+1, id1=i+1, id2=8-i,
+                          game_date=tournament.start_date_playoff, start_time="1{}:00:00".format(i+2)))
 
     semi_day = tournament.start_date_playoff + timedelta(days=1)
     for i in range(2):
-        g = Game(tournament=tournament, game_id=i+5, id1=i+1, id2=4-i,
-                 game_date=semi_day, start_time="1{}:00:00".format(i*2+3))
-        g.save()
+        games.append(Game(tournament=tournament, game_id=i+5, id1=i+1, id2=4-i,
+                          game_date=semi_day, start_time="1{}:00:00".format(i*2+3)))
 
     final_day = tournament.start_date_playoff + timedelta(days=2)
 
-    g = Game(tournament=tournament, game_id=7, id1=-5, id2=-6,
-             game_date=final_day, start_time="13:00:00")
-    g.save()
-    g = Game(tournament=tournament, game_id=8, id1=5, id2=6,
-             game_date=final_day, start_time="15:00:00")
-    g.save()
-
-
-def get_time(start_time):
-    tournament = get_current_tournament()
-    TIME_INTERVAL = tournament.game_duration
-    # return str(datetime.strptime(start_time, '%H:%M') + timedelta(minutes=TIME_INTERVAL))[11:-3]
-    t = datetime.combine(datetime(1,1,1), start_time) + TIME_INTERVAL
-    return t.time()
-
-
-def get_dates():
-    tournament = get_current_tournament()
-    START_DAY = tournament.start_date
-    NUMBER_OF_DAYS = tournament.start_date_playoff - tournament.start_date
-    NUMBER_OF_DAYS = NUMBER_OF_DAYS.days
-    days = []
-
-    i = 0
-    day = START_DAY
-    while i < NUMBER_OF_DAYS:
-
-        i += 1
-        day_str = day.strftime("%a")
-
-        if "Sun" in day_str or "Sat" in day_str:
-            day = day + timedelta(days=1)
-            continue
-        days.append(day)
-        day = day + timedelta(days=1)
-
-    return days
-
-
-def players_this_day(games, day):
-    participants = []
-    for game in games:
-        if game.game_date == day:
-            participants.append(game.id1)
-            participants.append(game.id2)
-
-    return participants
-
-
-def have_slot_for_game(games, game, day, max_games=1):
-
-    players = [game.id1, game.id2]
-
-    for player in players:
-        if players_this_day(games, day).count(player) >= max_games:
-            return False
-    return True
-
-
-def games_this_day(games_all, day):
-    games = []
-    for game in games_all:
-        if game.game_date == day:
-            games.append(game)
-
+    games.append(Game(tournament=tournament, game_id=7, id1=-5, id2=-6,
+                      game_date=final_day, start_time="13:00:00"))
+    games.append(Game(tournament=tournament, game_id=8, id1=5, id2=6,
+                      game_date=final_day, start_time="15:00:00"))
     return games
 
 
-def last_game_time(games_all, day):
-    games = games_this_day(games_all, day)
-    try:
-        games.sort(key=lambda g: datetime.combine(datetime(1,1,1), g.start_time))
-    except:
-        pass
-    return games[-1].start_time
-
-
-def initial_games_number(days_number):
-    t = get_current_tournament()
-    nop = t.number_of_participants()
-    gpp = t.games_per_person
-    if gpp % days_number == 0 and nop % 2 == 0:
-        return gpp // days_number
-    return gpp // days_number + 1
-
-
-def generate_schedule(games):
-    tournament = get_current_tournament()
-    START_TIME = tournament.game_start_time
-
-    days = get_dates()
-    num_of_days = len(days)
-    not_set_games = []
-
+def save_draw(games):
+    """
+    Insert the drawn games at once. Duplicates are rejected by the database (IntegrityError),
+    in which case nothing is saved.
+    """
     for game in games:
-        for i in range(num_of_days):
-            if have_slot_for_game(games, game, days[i]):
-                if len(games_this_day(games, days[i])) == 0:
-                    game_time = START_TIME
-                else:
-                    game_time = get_time(last_game_time(games, days[i]))
-
-                game.start_time = game_time
-                game.game_date = days[i]
+        game.order_pair()
+    with transaction.atomic():
+        Game.objects.bulk_create(games)
+        if games:
+            link_games(games[0].tournament)
+
+
+def link_games(tournament):
+    """
+    Set participants of the group stage games by drawn numbers and count their games, in three UPDATEs,
+    then invalidate the cached pages of the tournament.
+    """
+    participants = Participant.objects.filter(tournament=tournament)
+    games = Game.objects.filter(tournament=tournament, game_id=0)
+    games.update(
+        participant1=Subquery(participants.filter(drawn_number=OuterRef('id1')).values('pk')[:1]),
+        participant2=Subquery(participants.filter(drawn_number=OuterRef('id2')).values('pk')[:1]),
+    )
+    own_games = games.filter(Q(participant1=OuterRef('pk')) | Q(participant2=OuterRef('pk')), is_played=False)
+    participants.update(games_left=Coalesce(Subquery(own_games.order_by().values('tournament')
+                                                     .annotate(count=Count('pk')).values('count')), 0))
+    participants.filter(drawn_number__isnull=False).update(initialized=True)
+    bump_data_version(tournament.pk)
+
+
+def run_draw(tournament, seed=None):
+    """
+    Give every participant of the tournament a random drawn number and link the group stage games.
+    The same seed gives the same numbers.
+    """
+    if SetResult.objects.filter(game__tournament=tournament).exists():
+        raise ValidationError(_("The draw cannot be changed after the first result"))
+
+    participants = list(tournament.participant_set.order_by('pk').values_list('pk', flat=True))
+    numbers = list(range(1, len(participants) + 1))
+    random.Random(seed).shuffle(numbers)
+
+    with transaction.atomic():
+        # Numbers are cleared first not to clash with the unique (tournament, drawn_number) while reassigning
+        tournament.participant_set.update(drawn_number=None)
+        tournament.participant_set.update(drawn_number=Case(
+            *[When(pk=pk, then=Value(number)) for pk, number in zip(participants, numbers)],
+            output_field=IntegerField()))
+        link_games(tournament)
+
+
+def get_dates(tournament=None):
+    """Days of the group stage: the business days from the start date to the start of play-off."""
+    tournament = tournament or get_current_tournament()
+    return get_calendar().business_days(tournament.start_date, tournament.start_date_playoff)
+
+
+def schedule_pairs(pairs, days, start_time, duration, tables=1, end_time=None, max_games=1):
+    """
+    Place pairs of drawn numbers into days and time slots, first fit: nobody plays more than max_games games
+    a day, `tables` games are played at the same time and the last game of a day finishes by end_time (if set).
+    Pairs which come round after round (see generate_pairs) are placed on the day of their round at the latest
+    as long as the tables allow.
+    Returns (slots, unplaced): slots[i] is (day, start time) of pairs[i] or None, unplaced is a list of
+    (pair, reason) for the pairs which could not be placed.
+    """
+    day_start = datetime.combine(date.min, start_time)
+    if end_time is None:
+        slots_per_day = None
+    else:
+        slots_per_day = max(0, (datetime.combine(date.min, end_time) - day_start) // duration) * tables
+
+    # Per day: how many games each player has and how many games are already placed
+    players = [{} for _ in days]
+    games_placed = [0] * len(days)
+    # No day has a slot when a game does not fit between start_time and end_time
+    open_days = list(range(len(days))) if slots_per_day != 0 else []
+
+    slots = []
+    unplaced = []
+    for pair in pairs:
+        id1, id2 = pair
+        placed = None
+        for i in open_days:
+            if players[i].get(id1, 0) < max_games and players[i].get(id2, 0) < max_games:
+                placed = i
                 break
-            if i == num_of_days - 1:
-                not_set_games.append(game)
 
-    if len(not_set_games) == 0:
-        for game in games:
-            game.save()
-        return True
-    else:
-        return False
+        if placed is None:
+            slots.append(None)
+            if slots_per_day == 0:
+                reason = "a game of {} does not fit between {} and {}".format(duration, start_time, end_time)
+            elif any(players[i].get(id1, 0) < max_games and players[i].get(id2, 0) < max_games
+                     for i in range(len(days))):
+                reason = "no free table before {} on the days both players are free".format(end_time)
+            else:
+                reason = "players #{} and #{} have no common free day".format(id1, id2)
+            unplaced.append((pair, reason))
+            continue
+
+        slot = games_placed[placed]
+        slots.append((days[placed], (day_start + duration * (slot // tables)).time()))
+        players[placed][id1] = players[placed].get(id1, 0) + 1
+        players[placed][id2] = players[placed].get(id2, 0) + 1
+        games_placed[placed] += 1
+        if slots_per_day is not None and games_placed[placed] >= slots_per_day:
+            open_days.remove(placed)
+
+    return slots, unplaced
+
+
+def generate_schedule(games, tournament=None):
+    """
+    Set date and start time of the games (they are not saved).
+    Returns a list of (game, reason) which could not be scheduled.
+    """
+    tournament = tournament or get_current_tournament()
+    slots, unplaced = schedule_pairs([(game.id1, game.id2) for game in games], get_dates(tournament),
+                                     tournament.game_start_time, tournament.game_duration,
+                                     tournament.number_of_tables, tournament.game_end_time)
+    if unplaced:
+        # unplaced follows the order of the games without a slot
+        missing = [game for game, slot in zip(games, slots) if slot is None]
+        return [(game, reason) for game, (pair, reason) in zip(missing, unplaced)]
+
+    for game, (day, start) in zip(games, slots):
+        game.game_date = day
+        game.start_time = start
+    return []
 
 
 def split_games_by_days(games):
@@ -263,86 +344,103 @@ def split_games_by_days(games):
     return days
 
 
-def recount_rating():
-    tournament = get_current_tournament()
-    for p in tournament.participant_set.all():
-        p.win_sets = 0
-        p.win_balls = 0
-        p.games_left = 0
-        for g in Game.objects.filter((Q(participant1=p) | Q(participant2=p)) & Q(game_id=0)):
-            if g.setresult_set.exists():
-                for r in g.setresult_set.all():
-                    if g.participant1 == p:
-                        if r.result1 > r.result2:
-                            p.win_sets += 1
-                        p.win_balls += r.result1 - r.result2
-                    else:
-                        if r.result2 > r.result1:
-                            p.win_sets += 1
-                        p.win_balls += r.result2 - r.result1
-            else:
-                p.games_left += 1
-        p.save(update_fields=["win_sets", "win_balls", "games_left"])
-
-
-def write_schedule_to_xls(days, num_of_sets):
-
-    xls_dir = r"tournament\static\tournament"
-    filename = "schedule.xlsx"
-
-    book = Workbook()
-    sheet = book.active
-    sheet.title = "Расписание"
-
-    row = 1
-    for day in days:
-        fill_flag = True
-        for i in range(len(day)):
-
-            # set data
-            sheet.cell(row, 1, day[i].game_date)
-            sheet.cell(row, 2, day[i].start_time)
-            sheet.cell(row, 3, str(day[i].get_p1()))
-            sheet.cell(row + 1, 3, str(day[i].get_p2()))
-
-            # set borders
-            thin = Side(border_style="thin", color="000000")
-            hair = Side(border_style="hair", color="000000")
-
-            top = Border(top=thin)
-            left = Border(left=thin)
-            right = Border(right=thin)
-            bottom = Border(bottom=thin)
-            left2 = Border(left=hair)
-
-            end_col = chr(ord('C') + num_of_sets)
-            rows = sheet['A' + str(row):end_col + str(row + 1)]
-
-            for cell in rows[0]:
-                cell.border = cell.border + top
-
-            for j in range(0, 4):
-                rows[0][j].border = rows[0][j].border + left
-                rows[1][j].border = rows[1][j].border + left
-            for j in range(4, len(rows[0])):
-                rows[0][j].border = rows[0][j].border + left2
-                rows[1][j].border = rows[1][j].border + left2
-            rows[0][-1].border = rows[0][-1].border + right
-            rows[1][-1].border = rows[1][-1].border + right
-
-            for cell in rows[-1]:
-                cell.border = cell.border + bottom
-
-            # set background
-            if fill_flag:
-                fill = PatternFill("solid", fgColor="DEDEDE")
-                for _row in rows:
-                    for cell in _row:
-                        cell.fill = fill
-                fill_flag = False
-            else:
-                fill_flag = True
-
-            row += 2
-        row += 1
-    book.save(os.path.join(BASE_DIR, xls_dir, filename))
+def recount_rating(tournament=None):
+    tournament = tournament or get_current_tournament()
+    for row in tournament.standings():
+        Participant.objects.filter(pk=row["pk"]).update(win_sets=row["sets_won"],
+                                                        win_balls=row["ball_difference"],
+                                                        games_left=row["games_remaining"])
+
+
+def xls_style(book, styles, column, number_of_columns, top, fill):
+    """
+    Named style of a schedule cell, created once per workbook: thin borders around a game and between
+    date, time, names and sets, hair borders between sets, every other game filled.
+    """
+    name = "game-{}-{}-{}".format(min(column, 4) if column < number_of_columns - 1 else "last", top, fill)
+    if name not in styles:
+        thin = Side(border_style="thin", color="000000")
+        hair = Side(border_style="hair", color="000000")
+        style = NamedStyle(name=name)
+        style.border = Border(left=thin if column <= 3 else hair,
+                              right=thin if column == number_of_columns - 1 else None,
+                              top=thin if top else None,
+                              bottom=None if top else thin)
+        if fill:
+            style.fill = PatternFill("solid", fgColor="DEDEDE")
+        if column == 0:
+            style.number_format = "DD.MM.YYYY"
+        elif column == 1:
+            style.number_format = "HH:MM"
+        book.add_named_style(style)
+        styles[name] = style
+    return name
+
+
+def write_schedule_to_xls(days, num_of_sets, path):
+    """
+    Write the schedule into an .xlsx file, one sheet per stage: `days` is a list of (sheet title, games by days).
+    Games must have their set results prefetched.
+    """
+    book = Workbook(write_only=True)
+    styles = {}
+    number_of_columns = 3 + num_of_sets
+
+    for title, stage_days in days:
+        sheet = book.create_sheet(title)
+        sheet.column_dimensions['A'].width = 12
+        sheet.column_dimensions['C'].width = 32
+
+        for day in stage_days:
+            fill = True
+            for game in day:
+                results = list(game.setresult_set.all())
+                rows = ([game.game_date, game.start_time, str(game.get_p1())] + [r.result1 for r in results],
+                        [None, None, str(game.get_p2())] + [r.result2 for r in results])
+                for top, values in zip((True, False), rows):
+                    row = []
+                    for column in range(number_of_columns):
+                        cell = WriteOnlyCell(sheet, values[column] if column < len(values) else None)
+                        cell.style = xls_style(book, styles, column, number_of_columns, top, fill)
+                        row.append(cell)
+                    sheet.append(row)
+                fill = not fill
+            sheet.append([])
+
+    book.save(path)
+
+
+def export_schedule(tournament):
+    """
+    Return the path of the .xlsx schedule of the tournament with the results.
+    Files are named by a hash of their content, so an unchanged schedule is not written again.
+    """
+    games = tournament.game_set.select_related('participant1__user', 'participant2__user')
+    games = list(games.prefetch_related('setresult_set').order_by('game_id', 'game_date', 'start_time', 'pk'))
+
+    fingerprint = hashlib.sha1()
+    for game in games:
+        fingerprint.update(repr((game.pk, game.game_id, game.game_date, game.start_time,
+                                 str(game.get_p1()), str(game.get_p2()),
+                                 [(r.set_number, r.result1, r.result2) for r in game.setresult_set.all()])).encode())
+    prefix = "schedule-{}-".format(tournament.pk)
+    path = os.path.join(settings.EXPORT_ROOT, "{}{}.xlsx".format(prefix, fingerprint.hexdigest()))
+    if os.path.exists(path):
+        return path
+
+    group_games = [g for g in games if g.game_id == 0]
+    playoff_games = [g for g in games if g.game_id != 0]
+    days = [("Расписание", split_games_by_days(group_games) if group_games else [])]
+    if playoff_games:
+        days.append(("Плей-офф", split_games_by_days(playoff_games)))
+
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    # Another process may be writing the same file: write aside, then rename atomically
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    write_schedule_to_xls(days, max(tournament.number_of_sets, 2 * tournament.number_of_wins - 1), tmp_path)
+    os.replace(tmp_path, path)
+
+    for name in os.listdir(settings.EXPORT_ROOT):
+        if name.startswith(prefix) and name.endswith(".xlsx") and name != os.path.basename(path):
+            os.remove(os.path.join(settings.EXPORT_ROOT, name))
+    return path
@@ -0,0 +1,71 @@
+import traceback
+from datetime import timedelta
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from tournament.models import DrawJob
+from tournament.functions import generate_games, generate_schedule, generate_playoff_games, save_draw
+
+# A running job which has not finished in this time is considered dead (its worker was killed)
+JOB_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_draw(tournament):
+    """Queue the draw of the tournament, or return the draw which is already queued or running."""
+    try:
+        with transaction.atomic():
+            return DrawJob.objects.create(tournament=tournament)
+    except IntegrityError:
+        return DrawJob.objects.get(tournament=tournament, status__in=(DrawJob.QUEUED, DrawJob.RUNNING))
+
+
+def claim_next_job():
+    """Take the oldest queued job; the conditional UPDATE makes sure only one worker gets it."""
+    for job in DrawJob.objects.filter(status=DrawJob.QUEUED).order_by('created')[:10]:
+        now = timezone.now()
+        if DrawJob.objects.filter(pk=job.pk, status=DrawJob.QUEUED).update(status=DrawJob.RUNNING, started=now):
+            job.status = DrawJob.RUNNING
+            job.started = now
+            return job
+    return None
+
+
+def fail_dead_jobs():
+    return DrawJob.objects.filter(status=DrawJob.RUNNING, started__lt=timezone.now() - JOB_TIMEOUT).update(
+        status=DrawJob.FAILED, finished=timezone.now(), message="The worker did not finish the draw in time")
+
+
+def run_draw_job(job):
+    tournament = job.tournament
+    if tournament.game_set.exists():
+        return finish_job(job, DrawJob.DONE, "The games have already been drawn")
+
+    job.attempts += 1
+    job.save(update_fields=['attempts'])
+    # One draw: its rounds fit the days Tournament.clean() requires, and a redraw has as many games for the tables
+    games = generate_games(tournament=tournament)
+    unplaced = generate_schedule(games, tournament)
+    if unplaced:
+        return finish_job(job, DrawJob.FAILED, "\n".join("{}: {}".format(game, reason) for game, reason in unplaced))
+    try:
+        save_draw(games + generate_playoff_games(tournament))
+    except IntegrityError:
+        return finish_job(job, DrawJob.FAILED, "The games have been drawn by someone else")
+    return finish_job(job, DrawJob.DONE, "{} games are drawn".format(len(games)))
+
+
+def finish_job(job, status, message):
+    job.status = status
+    job.message = message
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'message', 'finished'])
+    return job
+
+
+def run_next_job():
+    job = claim_next_job()
+    if job is None:
+        return None
+    try:
+        return run_draw_job(job)
+    except Exception:
+        return finish_job(job, DrawJob.FAILED, traceback.format_exc())
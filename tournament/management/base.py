@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from tournament.models import Tournament
+from tournament.functions import get_current_tournament
+
+
+class TournamentCommand(BaseCommand):
+    """A command on one tournament: --tournament, the current one by default."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tournament', type=int, help="tournament id (the current tournament by default)")
+
+    def get_tournament(self, options):
+        if options['tournament']:
+            try:
+                return Tournament.objects.get(pk=options['tournament'])
+            except Tournament.DoesNotExist:
+                raise CommandError("Tournament {} does not exist".format(options['tournament']))
+        tournament = get_current_tournament()
+        if tournament is None:
+            raise CommandError("There are no tournaments")
+        return tournament
@@ -0,0 +1,164 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (override_settings, setup_databases, setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+from django.utils import timezone
+from tournament.factories import create_tournament
+from tournament.functions import (generate_games, generate_schedule, recount_rating, split_games_by_days,
+                                  write_schedule_to_xls)
+
+SIZES = (16, 64, 256, 1024)
+PAGES = ('', 'participants/', 'games/', 'rating/', 'playoff/',
+         'api/status/', 'api/schedule/', 'api/standings/', 'api/bracket/')
+# A run is reported as slower than the compared one above this ratio of times
+SLOWER = 1.2
+
+
+class QueryCounter:
+    """Counts queries like CaptureQueriesContext, without its limit of 9000 logged queries."""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ("Time the draw, the schedule, the rating, the export and the public pages on synthetic tournaments "
+            "in a test database and write the results as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="numbers of participants")
+        parser.add_argument('--games-per-person', type=int, default=10)
+        parser.add_argument('--played', type=float, default=0.5, help="part of the group games with results")
+        parser.add_argument('--repeat', type=int, default=3, help="runs of each step, the fastest one is reported")
+        parser.add_argument('--output', default='benchmark.json', help="'-' for stdout")
+        parser.add_argument('--compare', help="JSON of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError("Cannot read {}: {}".format(options['compare'], e))
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+                results = [result for size in options['sizes'] for result in self.run_size(size, options)]
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        report = {'metadata': self.metadata(options), 'results': results}
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS("Results are written to {}".format(options['output'])))
+        if baseline is not None:
+            self.compare(baseline['results'], results)
+
+    def measure(self, name, size, func, repeat, setup=None):
+        """The fastest of `repeat` runs of func() and the number of queries of the last one."""
+        times = []
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                start = perf_counter()
+                func()
+                times.append(perf_counter() - start)
+        result = {'name': name, 'size': size, 'seconds': round(min(times), 6), 'queries': queries.count}
+        self.stdout.write("{size:>6} {name:<32} {seconds:>10.4f}s {queries:>6} queries".format(**result))
+        return result
+
+    def run_size(self, size, options):
+        start = perf_counter()
+        tournament = create_tournament(size, played=options['played'], games_per_person=options['games_per_person'])
+        self.stdout.write("{:>6} {:<32} {:>10.4f}s".format(size, "(create tournament)", perf_counter() - start))
+        repeat = options['repeat']
+        results = []
+
+        games = generate_games(seed=1, tournament=tournament)
+        results.append(self.measure('generate_games', size, lambda: generate_games(seed=1, tournament=tournament),
+                                    repeat))
+        results.append(self.measure('generate_schedule', size, lambda: generate_schedule(games, tournament), repeat))
+        results.append(self.measure('recount_rating', size, lambda: recount_rating(tournament), repeat))
+
+        saved = list(tournament.game_set.select_related('participant1__user', 'participant2__user')
+                     .prefetch_related('setresult_set').filter(game_id=0))
+        results.append(self.measure('split_games_by_days', size, lambda: split_games_by_days(saved), repeat))
+        days = [("Расписание", split_games_by_days(saved))]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schedule.xlsx')
+            results.append(self.measure('write_schedule_to_xls', size,
+                                        lambda: write_schedule_to_xls(days, tournament.number_of_sets, path), repeat))
+
+        client = Client()
+        for page in PAGES:
+            url = '/t/{}/{}'.format(tournament.pk, page)
+
+            def get():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError("{} returned {}".format(url, response.status_code))
+            # Cold: rendered from the database; cached: served by caching.cached_response
+            results.append(self.measure('view /' + page, size, get, repeat, setup=cache.clear))
+            results.append(self.measure('view /{} (cached)'.format(page), size, get, repeat))
+        return results
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'created': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'sizes': options['sizes'],
+            'games_per_person': options['games_per_person'],
+            'played': options['played'],
+            'repeat': options['repeat'],
+        }
+
+    def compare(self, old_results, results):
+        old = {(result['name'], result['size']): result for result in old_results}
+        self.stdout.write("\n{:>6} {:<32} {:>10} {:>10} {:>7} {:>9}".format(
+            'size', 'step', 'old, s', 'new, s', 'ratio', 'queries'))
+        for result in results:
+            before = old.get((result['name'], result['size']))
+            if before is None:
+                continue
+            ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+            line = "{:>6} {:<32} {:>10.4f} {:>10.4f} {:>6.2f}x {:>4} {:<4}".format(
+                result['size'], result['name'], before['seconds'], result['seconds'], ratio,
+                before['queries'], result['queries'])
+            if ratio > SLOWER or result['queries'] > before['queries']:
+                line = self.style.ERROR(line)
+            elif ratio < 1 / SLOWER or result['queries'] < before['queries']:
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
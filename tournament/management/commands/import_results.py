@@ -0,0 +1,32 @@
+import os
+from django.core.management.base import CommandError
+from tournament.management.base import TournamentCommand
+from tournament.results import import_results, FORMATS
+
+
+class Command(TournamentCommand):
+    help = "Import results of games from a CSV or JSONL file; nothing is saved if any row is invalid"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file with results, one game per row")
+        super().add_arguments(parser)
+        parser.add_argument('--format', choices=FORMATS, help="file format (by the file extension by default)")
+        parser.add_argument('--dry-run', action='store_true', help="only validate the file")
+
+    def handle(self, *args, **options):
+        tournament = self.get_tournament(options)
+
+        format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError("Unknown file format, use --format")
+        with open(options['path'], encoding='utf-8-sig') as f:
+            report = import_results(tournament, f.read(), format, dry_run=options['dry_run'])
+
+        for line, message in report.errors:
+            self.stderr.write("Line {}: {}".format(line, message))
+        if not report:
+            raise CommandError("{} invalid row(s), nothing is imported".format(len(report.errors)))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Results of {} game(s) are valid".format(len(report.games))))
+        else:
+            self.stdout.write(self.style.SUCCESS("Imported results of {} game(s)".format(len(report.games))))
@@ -0,0 +1,42 @@
+from django.core.management.base import CommandError
+from django.db import transaction
+from tournament.management.base import TournamentCommand
+from tournament.standings import refresh_game_summaries
+from tournament.caching import bump_data_version
+
+SUMMARY_FIELDS = ('sets1', 'sets2', 'points1', 'points2', 'winner', 'is_played')
+
+
+class Command(TournamentCommand):
+    help = "Recount the result summaries of games from their set results and report the drift"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--check', action='store_true', help="only report the drift, do not fix it")
+
+    def handle(self, *args, **options):
+        tournament = self.get_tournament(options)
+
+        games = tournament.game_set.all()
+        with transaction.atomic():
+            stored = {row['pk']: row for row in games.select_for_update().values('pk', *SUMMARY_FIELDS)}
+            refresh_game_summaries(games)
+            drift = 0
+            for game in games.select_related('participant1__user', 'participant2__user').order_by('game_id', 'pk'):
+                changed = [field for field in SUMMARY_FIELDS if stored[game.pk][field] != getattr(game, field)]
+                if not changed:
+                    continue
+                drift += 1
+                self.stdout.write("{}: {}".format(game, ", ".join(
+                    "{} {} -> {}".format(field, stored[game.pk][field], getattr(game, field)) for field in changed)))
+            if options['check']:
+                transaction.set_rollback(True)
+            elif drift:
+                bump_data_version(tournament.pk)
+
+        if drift and options['check']:
+            raise CommandError("Summaries of {} game(s) drifted".format(drift))
+        if drift:
+            self.stdout.write(self.style.SUCCESS("Fixed summaries of {} game(s)".format(drift)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Game summaries are consistent"))
@@ -0,0 +1,39 @@
+from django.core.management.base import CommandError
+from django.db import transaction
+from tournament.management.base import TournamentCommand
+
+
+class Command(TournamentCommand):
+    help = "Recount participants standings from scratch and report the drift of the incrementally kept values"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--check', action='store_true', help="only report the drift, do not fix it")
+
+    def handle(self, *args, **options):
+        tournament = self.get_tournament(options)
+
+        drift = 0
+        with transaction.atomic():
+            standings = {row['pk']: {'win_sets': row['sets_won'],
+                                     'win_balls': row['ball_difference'],
+                                     'games_left': row['games_remaining']} for row in tournament.standings()}
+            for p in tournament.participant_set.select_related('user').select_for_update():
+                expected = standings[p.pk]
+                changed = [field for field, value in expected.items() if getattr(p, field) != value]
+                if not changed:
+                    continue
+                drift += 1
+                self.stdout.write("{}: {}".format(p, ", ".join(
+                    "{} {} -> {}".format(field, getattr(p, field), expected[field]) for field in changed)))
+                if not options['check']:
+                    for field in changed:
+                        setattr(p, field, expected[field])
+                    p.save(update_fields=changed)
+
+        if drift and options['check']:
+            raise CommandError("Standings of {} participant(s) drifted".format(drift))
+        if drift:
+            self.stdout.write(self.style.SUCCESS("Fixed standings of {} participant(s)".format(drift)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Standings are consistent"))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from tournament.jobs import run_next_job, fail_dead_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the queued draws (worker process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="run the queued jobs and exit")
+        parser.add_argument('--interval', type=float, default=2, help="seconds between polls of the queue")
+
+    def handle(self, *args, **options):
+        while True:
+            dead = fail_dead_jobs()
+            if dead:
+                self.stderr.write("Marked {} dead job(s) as failed".format(dead))
+
+            job = run_next_job()
+            while job is not None:
+                self.stdout.write("{}: {}".format(job, job.message))
+                job = run_next_job()
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,124 @@
+import asyncio
+import cProfile
+import json
+import logging
+from time import perf_counter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.utils.deprecation import MiddlewareMixin
+from tournament.functions import get_current_tournament, get_tournament
+from tournament.querystats import QueryStats, current_stats, get_query_budget
+from tournament.profiling import timings, server_timing, profiling_asked, profiling_requested, save_profile
+
+logger = logging.getLogger('tournament.queries')
+
+
+class CurrentTournamentMiddleware(MiddlewareMixin):
+    """
+    Resolve the tournament once per request: views and helpers use request.tournament.
+    It is the tournament of the /t/<tournament_id>/... URLs and the current (latest) tournament otherwise.
+    """
+
+    def process_request(self, request):
+        request.tournament = get_current_tournament()
+        request.tournament_scoped = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.namespace == 't':
+            request.tournament = get_tournament(view_kwargs.pop('tournament_id'))
+            if request.tournament is None:
+                raise Http404("No such tournament")
+            request.tournament_scoped = True
+
+
+class QueryStatsMiddleware(MiddlewareMixin):
+    """
+    Count the queries of every request, log them as JSON (a warning above the query budget of the view)
+    and show them in X-Query-* headers with DEBUG. Must be the first middleware to see all the queries.
+    Every response gets a Server-Timing header: the time of the queries, of template rendering
+    (its lazy queries included) and of the whole request.
+    Queries of streaming responses, run while the response is sent, are not counted.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats, phases = QueryStats(), {}
+        tokens = current_stats.set(stats), timings.set(phases)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(tokens, stats, phases, start)
+        return self.record(request, response, stats, phases)
+
+    async def __acall__(self, request):
+        stats, phases = QueryStats(), {}
+        tokens = current_stats.set(stats), timings.set(phases)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(tokens, stats, phases, start)
+        return self.record(request, response, stats, phases)
+
+    def stop(self, tokens, stats, phases, start):
+        current_stats.reset(tokens[0])
+        timings.reset(tokens[1])
+        phases['db'] = stats.duration
+        phases.setdefault('template', 0)
+        phases['view'] = perf_counter() - start
+
+    def record(self, request, response, stats, phases):
+        response['Server-Timing'] = server_timing({phase: phases[phase] for phase in ('db', 'template', 'view')})
+
+        match = getattr(request, 'resolver_match', None)
+        budget = get_query_budget(match.func) if match else None
+        record = dict(method=request.method, path=request.path, view=match.view_name if match else None,
+                      status=response.status_code, budget=budget, **stats.as_dict())
+        over_budget = budget is not None and stats.count > budget
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(record),
+                   extra={'query_stats': record})
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = stats.count
+            response['X-Query-Time'] = '{:.2f}ms'.format(stats.duration * 1000)
+            response['X-Query-Slowest'] = ', '.join('{:.2f}ms'.format(duration * 1000)
+                                                    for duration, sql in stats.slowest)
+            if budget is not None:
+                response['X-Query-Budget'] = budget
+        return response
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Run the request under cProfile when staff ask for it (see profiling.profiling_requested)
+    and save the profile for the admin; its name is sent in the X-Profile header.
+    Must come after AuthenticationMiddleware.
+    Under ASGI only the event loop thread is profiled, not the ORM and the templates run by sync_to_async:
+    profile the same URL under WSGI (runserver) to see them.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not profiling_requested(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        response['X-Profile'] = save_profile(profiler, request)
+        return response
+
+    async def __acall__(self, request):
+        # request.user is loaded from the database: only when a profile is asked for
+        if not (profiling_asked(request) and await sync_to_async(profiling_requested)(request)):
+            return await self.get_response(request)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        response['X-Profile'] = await sync_to_async(save_profile)(profiler, request)
+        return response
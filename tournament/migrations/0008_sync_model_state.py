@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class AddFieldIfMissing(migrations.AddField):
+    """
+    AddField which keeps the column if the table has it already: databases made by the migrations of
+    December 2019, which are not in the repository, have these fields. SQLite rebuilds the table to add a field
+    and would overwrite their values with the default.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        with schema_editor.connection.cursor() as cursor:
+            columns = [column.name for column in
+                       schema_editor.connection.introspection.get_table_description(cursor, model._meta.db_table)]
+        if model._meta.get_field(self.name).column not in columns:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0007_tournament_debug'),
+    ]
+
+    operations = [
+        AddFieldIfMissing(
+            model_name='game',
+            name='game_id',
+            field=models.SmallIntegerField(choices=[(0, 'group stage'), (1, '1st quarter final'), (2, '2nd quarter final'), (3, '3d quarter final'), (4, '4th quarter final'), (5, '1st semifinal'), (6, '2nd semifinal'), (7, 'match for 3d place'), (8, 'final')], default=0, verbose_name='Game identifier'),
+        ),
+        AddFieldIfMissing(
+            model_name='tournament',
+            name='number_of_wins',
+            field=models.SmallIntegerField(default=4, verbose_name='number of sets to win in one game in play-off'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='participant1',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='participant1', to='tournament.participant'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='participant2',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='participant2', to='tournament.participant'),
+        ),
+        migrations.AlterField(
+            model_name='tournament',
+            name='description',
+            field=models.TextField(default='\n    Вначале каждый участник играет 6-10 игр (в зависимости от количества участников) со случайными соперниками. \n    Одна игра состоит из 5 коротких партий (вне зависимости от количества побед каждого из игроков). \n    За каждую победную партию игроку присуждается 1 очко. После всех игр данного этапа составляется рейтинг участников \n    и первые 8 игроков в рейтинге выходят в плей-офф. В случае равенства очков по количеству выигранных партий \n    учитывается разница забитых и пропущенных мячей. В случае равенства и этого показателя учитывается результат личной \n    встречи, если таковая была. Если игроки на данном этапе не встречались, назначается дополнительная игра до 3 побед \n    в коротких партиях. </br></br>\n\n    Каждая игра этапа плей-офф играется до 4 побед в коротких партиях. </br></br>\n\n    NEW: Участники турнира должны сами отправлять результаты своих игр через "личный кабинет" на данном сайте. \n    Достаточно, чтобы это сделал один из участников каждой игры. Рейтинг будет обновляться автоматически.</br></br>\n    ', verbose_name='description'),
+        ),
+    ]
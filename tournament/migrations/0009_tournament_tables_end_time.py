@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0008_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='game_end_time',
+            field=models.TimeField(blank=True, help_text='the last game of a day must finish by this time', null=True, verbose_name='games end time'),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='number_of_tables',
+            field=models.SmallIntegerField(default=1, verbose_name='number of tables (games played at the same time)'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:47
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.functions import Greatest, Least
+import django.db.models.expressions
+
+
+def delete_duplicate_games(apps, schema_editor):
+    """
+    Keep one game of each pair of drawn numbers: the played one, or the first one if none is played.
+    Games with results are never deleted: if a pair has more than one, the migration stops and lists them.
+    """
+    Game = apps.get_model('tournament', 'Game')
+    SetResult = apps.get_model('tournament', 'SetResult')
+    games = Game.objects.annotate(low=Least('id1', 'id2'), high=Greatest('id1', 'id2'))
+    duplicates = (games.values('tournament', 'game_id', 'low', 'high').annotate(count=Count('pk'))
+                  .filter(count__gt=1).order_by('tournament', 'game_id', 'low', 'high'))
+    played_twice = []
+    for duplicate in duplicates:
+        played = Exists(SetResult.objects.filter(game=OuterRef('pk')))
+        pair = list(games.filter(tournament=duplicate['tournament'], game_id=duplicate['game_id'],
+                                 low=duplicate['low'], high=duplicate['high'])
+                    .annotate(played=played).order_by('-played', 'pk'))
+        if sum(game.played for game in pair) > 1:
+            played_twice.append("tournament {tournament}, game_id {game_id}: ({low}, {high})".format(**duplicate))
+            continue
+        Game.objects.filter(pk__in=[game.pk for game in pair[1:]]).delete()
+    if played_twice:
+        raise RuntimeError("Pairs played more than once, delete the extra games and their results first:\n" +
+                           "\n".join(played_twice))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0009_tournament_tables_end_time'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.CheckConstraint(check=models.Q(('id1', django.db.models.expressions.F('id2')), _negated=True), name='game_different_participants'),
+        ),
+        migrations.RunPython(delete_duplicate_games, migrations.RunPython.noop),
+        # Order of the drawn numbers does not matter: (1, 2) and (2, 1) is the same game
+        migrations.RunSQL(
+            sql='CREATE UNIQUE INDEX "tournament_game_unique_pair" ON "tournament_game" ('
+                '"tournament_id", "game_id", '
+                '(CASE WHEN "id1" < "id2" THEN "id1" ELSE "id2" END), '
+                '(CASE WHEN "id1" < "id2" THEN "id2" ELSE "id1" END))',
+            reverse_sql='DROP INDEX "tournament_game_unique_pair"',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:48
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tournament', '0010_game_unique_pair'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='participant',
+            unique_together={('tournament', 'drawn_number'), ('tournament', 'user')},
+        ),
+    ]
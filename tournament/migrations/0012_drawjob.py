@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0011_participant_unique_drawn_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrawJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.SmallIntegerField(choices=[(0, 'queued'), (1, 'running'), (2, 'done'), (3, 'failed')], default=0, verbose_name='status')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='attempts made')),
+                ('message', models.TextField(blank=True, verbose_name='message')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tournament.tournament')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='drawjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', (0, 1))), fields=('tournament',), name='one_active_draw_per_tournament'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+def fill_game_summaries(apps, schema_editor):
+    Game = apps.get_model('tournament', 'Game')
+    for game in Game.objects.prefetch_related('setresult_set'):
+        results = list(game.setresult_set.all())
+        if not results:
+            continue
+        game.sets1 = sum(1 for r in results if r.result1 > r.result2)
+        game.sets2 = sum(1 for r in results if r.result2 > r.result1)
+        game.points1 = sum(r.result1 for r in results)
+        game.points2 = sum(r.result2 for r in results)
+        game.winner = 1 if game.sets1 > game.sets2 else 2
+        game.is_played = True
+        game.save(update_fields=['sets1', 'sets2', 'points1', 'points2', 'winner', 'is_played'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0012_drawjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='is_played',
+            field=models.BooleanField(default=False, verbose_name='has results'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='points1',
+            field=models.SmallIntegerField(default=0, verbose_name='points of participant1'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='points2',
+            field=models.SmallIntegerField(default=0, verbose_name='points of participant2'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='sets1',
+            field=models.SmallIntegerField(default=0, verbose_name='sets won by participant1'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='sets2',
+            field=models.SmallIntegerField(default=0, verbose_name='sets won by participant2'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='winner',
+            field=models.SmallIntegerField(blank=True, choices=[(1, 'participant1'), (2, 'participant2')], null=True, verbose_name='winner'),
+        ),
+        # SQLite rebuilds the table to add the columns and loses the index of migration 0010
+        migrations.RunSQL(
+            sql='CREATE UNIQUE INDEX IF NOT EXISTS "tournament_game_unique_pair" ON "tournament_game" ('
+                '"tournament_id", "game_id", '
+                '(CASE WHEN "id1" < "id2" THEN "id1" ELSE "id2" END), '
+                '(CASE WHEN "id1" < "id2" THEN "id2" ELSE "id1" END))',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunPython(fill_game_summaries, migrations.RunPython.noop),
+    ]
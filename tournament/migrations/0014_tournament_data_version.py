@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0013_game_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='data_updated',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='data update time'),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='data version'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0015_resultevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['tournament', 'game_id', 'game_date', 'start_time'], name='game_schedule_idx'),
+        ),
+    ]
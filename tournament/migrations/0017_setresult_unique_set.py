@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:18
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_sets(apps, schema_editor):
+    """
+    Keep the first saved result of each set. The summaries of the games are recounted,
+    the standings are not: run rebuild_standings if any duplicates were deleted.
+    """
+    Game = apps.get_model('tournament', 'Game')
+    SetResult = apps.get_model('tournament', 'SetResult')
+    duplicates = (SetResult.objects.values('game', 'set_number').annotate(first=Min('pk'), count=Count('pk'))
+                  .filter(count__gt=1))
+    games = set()
+    for duplicate in duplicates:
+        SetResult.objects.filter(game=duplicate['game'], set_number=duplicate['set_number'],
+                                 pk__gt=duplicate['first']).delete()
+        games.add(duplicate['game'])
+    for game in Game.objects.filter(pk__in=games).prefetch_related('setresult_set'):
+        results = list(game.setresult_set.all())
+        game.sets1 = sum(1 for r in results if r.result1 > r.result2)
+        game.sets2 = sum(1 for r in results if r.result2 > r.result1)
+        game.points1 = sum(r.result1 for r in results)
+        game.points2 = sum(r.result2 for r in results)
+        game.winner = 1 if game.sets1 > game.sets2 else 2
+        game.save(update_fields=['sets1', 'sets2', 'points1', 'points2', 'winner'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0016_game_schedule_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='setresult',
+            name='submission',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(delete_duplicate_sets, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='setresult',
+            unique_together={('game', 'set_number')},
+        ),
+    ]
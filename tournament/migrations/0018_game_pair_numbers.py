@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models.functions import Greatest, Least
+
+
+def order_pairs(apps, schema_editor):
+    Game = apps.get_model('tournament', 'Game')
+    Game.objects.update(low_number=Least('id1', 'id2'), high_number=Greatest('id1', 'id2'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0017_setresult_unique_set'),
+    ]
+
+    operations = [
+        # The expression index of migrations 0010 and 0013 is unknown to the model state,
+        # and SQLite drops it whenever it rebuilds the table
+        migrations.RunSQL(
+            sql='DROP INDEX IF EXISTS "tournament_game_unique_pair"',
+            reverse_sql='CREATE UNIQUE INDEX IF NOT EXISTS "tournament_game_unique_pair" ON "tournament_game" ('
+                        '"tournament_id", "game_id", '
+                        '(CASE WHEN "id1" < "id2" THEN "id1" ELSE "id2" END), '
+                        '(CASE WHEN "id1" < "id2" THEN "id2" ELSE "id1" END))',
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='low_number',
+            field=models.SmallIntegerField(default=0, editable=False, verbose_name='lower drawn number'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='high_number',
+            field=models.SmallIntegerField(default=0, editable=False, verbose_name='higher drawn number'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(order_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.CheckConstraint(check=models.Q(('high_number', Greatest('id1', 'id2')), ('low_number', Least('id1', 'id2'))), name='game_ordered_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.UniqueConstraint(fields=('tournament', 'game_id', 'low_number', 'high_number'), name='game_unique_pair'),
+        ),
+    ]
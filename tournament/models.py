@@ -1,10 +1,14 @@
 from django.db import models
+from django.db import transaction, IntegrityError
+from django.db.models import Q, F, Case, When, Count, Sum, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from datetime import datetime, date
-from pandas.tseries.offsets import BDay
+from tournament.businessdays import get_calendar
+from tournament.validators import validate_set
 
 
 class Tournament(models.Model):
@@ -38,6 +42,13 @@ class Tournament(models.Model):
     number_of_wins = models.SmallIntegerField('number of sets to win in one game in play-off', default=4)
     game_start_time = models.TimeField('games start time', default="11:00:00")
     game_duration = models.DurationField('games duration', default="00:30:00")
+    game_end_time = models.TimeField('games end time', blank=True, null=True,
+                                     help_text='the last game of a day must finish by this time')
+    number_of_tables = models.SmallIntegerField('number of tables (games played at the same time)', default=1)
+
+    # Bumped on every change of the tournament data, see tournament.caching
+    data_version = models.PositiveIntegerField('data version', default=0, editable=False)
+    data_updated = models.DateTimeField('data update time', blank=True, null=True, editable=False)
 
     def __str__(self):
         return "{} - {}".format(date.strftime(self.start_date, '%d %B %Y'), date.strftime(self.end_date, '%d %B %Y'))
@@ -50,15 +61,56 @@ class Tournament(models.Model):
                 raise ValidationError(_('Draw time cannot be earlier or equal the registration end time'))
             if self.start_date <= self.draw_time.date():
                 raise ValidationError(_('Start date cannot be earlier or equal the draw date'))
-            if self.start_date_playoff < self.start_date + BDay(self.games_per_person + 1):
+            calendar = get_calendar()
+            if self.start_date_playoff < calendar.add(self.start_date, self.games_per_person + 1):
                 raise ValidationError(_('Start date of play-off cannot be earlier than {} business '
                                         'days after start date'.format(self.games_per_person + 1)))
-            if self.end_date < self.start_date_playoff + BDay(2):
+            if self.end_date < calendar.add(self.start_date_playoff, 2):
                 raise ValidationError(_('End date cannot be earlier than 2 business days after start date of play-off'))
+        if self.number_of_tables < 1:
+            raise ValidationError(_('Number of tables must be at least 1'))
+        if self.game_end_time is not None and self.game_end_time <= self.game_start_time:
+            raise ValidationError(_('Games end time must be later than games start time'))
 
     def number_of_participants(self):
         return self.participant_set.count()
 
+    def standings(self):
+        """
+        Group stage rating computed by the database in one query.
+        Returns dicts with participant's pk, drawn_number, first_name, last_name, sets_won, ball_difference,
+        games_played and games_remaining, best participant first.
+        """
+        def side(queryset, field, expression):
+            # Aggregate of the games of the participant on one side: an index search by participant1 or
+            # participant2 (an OR of both sides would scan all the sets of the tournament for every participant)
+            queryset = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+            return Coalesce(Subquery(queryset.annotate(value=expression).values('value'),
+                                     output_field=IntegerField()), 0)
+
+        # The participants are of this tournament: filtering on it too would make SQLite scan its games instead
+        sets = SetResult.objects.filter(game__game_id=0)
+        games = Game.objects.filter(game_id=0)
+        won1 = Sum(Case(When(result1__gt=F('result2'), then=1), default=0, output_field=IntegerField()))
+        won2 = Sum(Case(When(result2__gt=F('result1'), then=1), default=0, output_field=IntegerField()))
+
+        sets_won = side(sets, 'game__participant1', won1) + side(sets, 'game__participant2', won2)
+        ball_difference = (side(sets, 'game__participant1', Sum(F('result1') - F('result2'))) +
+                           side(sets, 'game__participant2', Sum(F('result2') - F('result1'))))
+        games_played = (side(sets, 'game__participant1', Count('game', distinct=True)) +
+                        side(sets, 'game__participant2', Count('game', distinct=True)))
+        games_total = side(games, 'participant1', Count('pk')) + side(games, 'participant2', Count('pk'))
+
+        return self.participant_set.annotate(
+            sets_won=sets_won,
+            ball_difference=ball_difference,
+            games_played=games_played,
+            games_remaining=games_total - games_played,
+        ).order_by('-sets_won', '-ball_difference', 'pk').values(
+            'pk', 'drawn_number', 'sets_won', 'ball_difference', 'games_played', 'games_remaining',
+            first_name=F('user__first_name'), last_name=F('user__last_name'),
+        )
+
     def get_status(self):
         # Registration is open
         if timezone.now() < self.reg_end:
@@ -87,42 +139,42 @@ class Participant(models.Model):
     games_left = models.IntegerField(default=10)
 
     class Meta:
-        unique_together = ('tournament', 'user')
+        unique_together = (('tournament', 'user'), ('tournament', 'drawn_number'))
 
     def __hash__(self):
-        return hash((self.tournament, self.user))
+        return hash((self.tournament_id, self.user_id))
 
     def __str__(self):
         return "{} {}".format(self.user.first_name, self.user.last_name)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.tournament == other.tournament and self.user == other.user
+            return self.tournament_id == other.tournament_id and self.user_id == other.user_id
         return False
 
     def __ne__(self, other):
-        return self.tournament != other.tournament or self.user != other.user
+        return not self == other
 
     def save(self, *args, **kwargs):
-        if not self.initialized and self.drawn_number:
-            games = self.tournament.game_set.filter(game_id=0)
-            for game in games:
-                if game.id1 == self.drawn_number:
-                    game.participant1 = self
-                    game.save(first_call=False)
-                if game.id2 == self.drawn_number:
-                    game.participant2 = self
-                    game.save(first_call=False)
-            self.initialized = True
-
-        super(Participant, self).save(*args, **kwargs)
-
-    def clean(self):
-        if self.drawn_number is not None:
-            drawn_numbers = [p.drawn_number for p in self.tournament.participant_set.all() if p != self]
-            if self.drawn_number in drawn_numbers:
-                raise ValidationError(_("Number '{}' is already assigned "
-                                        "to another participant".format(self.drawn_number)))
+        if self.initialized or not self.drawn_number:
+            super(Participant, self).save(*args, **kwargs)
+            return
+
+        games = Game.objects.filter(tournament=self.tournament_id, game_id=0)
+        self.games_left = games.filter(Q(id1=self.drawn_number) | Q(id2=self.drawn_number)).count()
+        self.initialized = True
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'initialized', 'games_left'}
+        with transaction.atomic():
+            super(Participant, self).save(*args, **kwargs)
+            games.filter(id1=self.drawn_number).update(participant1=self)
+            games.filter(id2=self.drawn_number).update(participant2=self)
+
+    def unique_error_message(self, model_class, unique_check):
+        if tuple(unique_check) == ('tournament', 'drawn_number'):
+            return ValidationError(_("Number '{}' is already assigned "
+                                     "to another participant".format(self.drawn_number)))
+        return super(Participant, self).unique_error_message(model_class, unique_check)
 
 
 class Game(models.Model):
@@ -142,6 +194,9 @@ class Game(models.Model):
 
     id1 = models.SmallIntegerField('participant1 drawn number')
     id2 = models.SmallIntegerField('participant2 drawn number')
+    # id1 and id2 in ascending order, for the unique pair: (1, 2) and (2, 1) is the same game
+    low_number = models.SmallIntegerField('lower drawn number', editable=False)
+    high_number = models.SmallIntegerField('higher drawn number', editable=False)
 
     participant1 = models.ForeignKey(Participant, to_field='id', on_delete=models.CASCADE, related_name='participant1',
                                      blank=True, null=True)
@@ -151,8 +206,34 @@ class Game(models.Model):
     game_date = models.DateField('game date', blank=True, null=True)
     start_time = models.TimeField('game start time', blank=True, null=True)
 
+    # Summary of the set results, refreshed by tournament.signals in the transaction which changes them
+    winners = (
+        (1, 'participant1'),
+        (2, 'participant2'),
+    )
+    sets1 = models.SmallIntegerField('sets won by participant1', default=0)
+    sets2 = models.SmallIntegerField('sets won by participant2', default=0)
+    points1 = models.SmallIntegerField('points of participant1', default=0)
+    points2 = models.SmallIntegerField('points of participant2', default=0)
+    winner = models.SmallIntegerField('winner', choices=winners, blank=True, null=True)
+    is_played = models.BooleanField('has results', default=False)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=~Q(id1=F('id2')), name='game_different_participants'),
+            models.CheckConstraint(check=Q(low_number=Least('id1', 'id2'), high_number=Greatest('id1', 'id2')),
+                                   name='game_ordered_pair'),
+            # A couple plays only once at each stage
+            models.UniqueConstraint(fields=['tournament', 'game_id', 'low_number', 'high_number'],
+                                    name='game_unique_pair'),
+        ]
+        # Schedule pages of one tournament: WHERE tournament AND game_id ORDER BY game_date, start_time
+        indexes = [
+            models.Index(fields=['tournament', 'game_id', 'game_date', 'start_time'], name='game_schedule_idx'),
+        ]
+
     def __hash__(self):
-        return hash((self.tournament, self.participant1, self.participant2))
+        return hash((self.tournament_id, self.game_id, min(self.id1, self.id2), max(self.id1, self.id2)))
 
     def __str__(self):
         p1 = self.participant1 or self.id1
@@ -161,23 +242,34 @@ class Game(models.Model):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.tournament == other.tournament and self.game_id == other.game_id and \
+            return self.tournament_id == other.tournament_id and self.game_id == other.game_id and \
                    ((self.id1 == other.id1 and self.id2 == other.id2) or
                     (self.id1 == other.id2 and self.id2 == other.id1))
         return False
 
     def __ne__(self, other):
-        return self.tournament != other.tournament or self.game_id != other.game_id or \
-               ((self.id1 != other.id1 or self.id2 != other.id2) and
-                (self.id1 != other.id2 or self.id2 != other.id1))
+        return not self == other
+
+    def order_pair(self):
+        """Set low_number and high_number from id1 and id2; save() does it, bulk_create() callers must."""
+        self.low_number, self.high_number = sorted((self.id1, self.id2))
 
     def save(self, first_call=True, *args, **kwargs):
-        if first_call:
-            if self.id1 == self.id2:
-                raise ValidationError(_("Participant1 and Participant2 are the same person"), code=1)
-            if self in self.tournament.game_set.all():
-                raise ValidationError(_("Duplicate game : {}".format(self)), code=2)
-        super(Game, self).save(*args, **kwargs)
+        if first_call and self.id1 == self.id2:
+            raise ValidationError(_("Participant1 and Participant2 are the same person"), code=1)
+        self.order_pair()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'low_number', 'high_number'}
+        try:
+            with transaction.atomic():
+                super(Game, self).save(*args, **kwargs)
+        except IntegrityError:
+            # Other integrity errors are not the user's duplicate
+            duplicates = Game.objects.filter(tournament=self.tournament_id, game_id=self.game_id,
+                                             low_number=self.low_number, high_number=self.high_number)
+            if not duplicates.exclude(pk=self.pk).exists():
+                raise
+            raise ValidationError(_("Duplicate game : {}".format(self)), code=2)
 
     def get_p1(self):
         if self.participant1:
@@ -218,35 +310,17 @@ class Game(models.Model):
             return None
 
     def get_winner(self):
-        results = self.setresult_set.all()
-        if results:
-            p1_sets = 0
-            p2_sets = 0
-            for result in results:
-                if result.result1 > result.result2:
-                    p1_sets += 1
-                else:
-                    p2_sets += 1
-            if p1_sets > p2_sets:
-                return self.participant1
-            else:
-                return self.participant2
+        if self.winner == 1:
+            return self.participant1
+        if self.winner == 2:
+            return self.participant2
         return None
 
     def get_loser(self):
-        results = self.setresult_set.all()
-        if results:
-            p1_sets = 0
-            p2_sets = 0
-            for result in results:
-                if result.result1 > result.result2:
-                    p1_sets += 1
-                else:
-                    p2_sets += 1
-            if p1_sets < p2_sets:
-                return self.participant1
-            else:
-                return self.participant2
+        if self.winner == 1:
+            return self.participant2
+        if self.winner == 2:
+            return self.participant1
         return None
 
 
@@ -255,33 +329,56 @@ class SetResult(models.Model):
     set_number = models.SmallIntegerField('set number')
     result1 = models.SmallIntegerField('participant1 result')
     result2 = models.SmallIntegerField('participant2 result')
+    # Idempotency key of the form which submitted the game (see results.submit_results)
+    submission = models.UUIDField(blank=True, null=True, editable=False)
 
-    # class Meta:
-    #    unique_together = ('game', 'set_number')
+    class Meta:
+        unique_together = ('game', 'set_number')
 
     def __str__(self):
         return "{} {} set result: {} {}".format(self.game, self.set_number, self.result1, self.result2)
 
     def save(self, *args, **kwargs):
-        if self.result1 > self.result2:
-            if self.result1 - self.result2 > 2:
-                if self.result1 != 11:
-                    raise ValidationError(_("Result must be 11"))
-            elif self.result1 - self.result2 == 1:
-                raise ValidationError(_("Point difference must be at least 2"))
-            else:
-                if self.result1 < 11:
-                    raise ValidationError(_("Result must be at least 11"))
-        elif self.result2 > self.result1:
-            if self.result2 - self.result1 > 2:
-                if self.result2 != 11:
-                    raise ValidationError(_("Result must be 11"))
-            elif self.result2 - self.result1 == 1:
-                raise ValidationError(_("Point difference must be at least 2"))
-            else:
-                if self.result2 < 11:
-                    raise ValidationError(_("Result must be at least 11"))
-        else:
-            raise ValidationError(_("Results cannot be equal"))
+        validate_set(self.result1, self.result2)
 
-        super(SetResult, self).save(*args, **kwargs)
+        # Participants standings are updated by signals within the same transaction
+        with transaction.atomic():
+            super(SetResult, self).save(*args, **kwargs)
+
+
+class DrawJob(models.Model):
+    QUEUED, RUNNING, DONE, FAILED = range(4)
+    statuses = (
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed'),
+    )
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE)
+    status = models.SmallIntegerField('status', choices=statuses, default=QUEUED)
+    attempts = models.SmallIntegerField('attempts made', default=0)
+    message = models.TextField('message', blank=True)
+    created = models.DateTimeField('created', auto_now_add=True)
+    started = models.DateTimeField('started', blank=True, null=True)
+    finished = models.DateTimeField('finished', blank=True, null=True)
+
+    class Meta:
+        # Only one draw of a tournament can be queued or running
+        constraints = [
+            models.UniqueConstraint(fields=['tournament'], condition=Q(status__in=(0, 1)),
+                                    name='one_active_draw_per_tournament'),
+        ]
+
+    def __str__(self):
+        return "Draw of {} ({})".format(self.tournament, self.get_status_display())
+
+
+class ResultEvent(models.Model):
+    """Outbox of result changes: written in the transaction of the change, streamed to the pages by tournament.events"""
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    payload = models.TextField('event data (JSON)')
+    created = models.DateTimeField('created', auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return "Event #{} of {}".format(self.pk, self.game)
@@ -0,0 +1,100 @@
+import os
+import re
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from time import perf_counter
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from django.utils import timezone
+
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_SUFFIX = '.prof'
+PROFILE_NAME = re.compile(r'^[\w.-]+\.prof$')
+
+# Seconds spent in each phase of the current request, None outside of requests
+timings = ContextVar('timings', default=None)
+
+
+def add_timing(phase, seconds):
+    current = timings.get()
+    if current is not None:
+        current[phase] = current.get(phase, 0) + seconds
+
+
+def server_timing(phases):
+    """Server-Timing header value: phase name -> seconds."""
+    return ', '.join('{};dur={:.1f}'.format(phase, seconds * 1000) for phase, seconds in phases.items())
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            add_timing('template', perf_counter() - start)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend which adds the time of rendering to the Server-Timing header."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+def profiling_asked(request):
+    requested = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    return bool(requested) and requested != '0'
+
+
+def profiling_requested(request):
+    """Staff can profile any request with ?profile=1 or an X-Profile: 1 header."""
+    return profiling_asked(request) and request.user.is_staff
+
+
+def save_profile(profiler, request):
+    """Dump the profile to PROFILE_DIR and delete the oldest ones over PROFILE_KEEP; returns the file name."""
+    match = getattr(request, 'resolver_match', None)
+    view = re.sub(r'[^\w-]', '_', match.view_name) if match else 'unknown'
+    name = '{}-{}-{}{}'.format(timezone.now().strftime('%Y%m%d-%H%M%S-%f'), request.method.lower(), view,
+                               PROFILE_SUFFIX)
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+    for old in list_profiles()[settings.PROFILE_KEEP:]:
+        try:
+            os.remove(profile_path(old['name']))
+        except FileNotFoundError:
+            pass
+    return name
+
+
+def list_profiles():
+    """Saved profiles, the newest first."""
+    try:
+        names = [name for name in os.listdir(settings.PROFILE_DIR) if PROFILE_NAME.match(name)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        try:
+            stat = os.stat(profile_path(name))
+        except FileNotFoundError:
+            continue
+        profiles.append({'name': name, 'size': stat.st_size,
+                         'created': datetime.fromtimestamp(stat.st_mtime, dt_timezone.utc)})
+    return profiles
+
+
+def profile_path(name):
+    """Path of a saved profile; the name comes from the URL and may not point outside PROFILE_DIR."""
+    if not PROFILE_NAME.match(name) or name.startswith('.'):
+        raise FileNotFoundError(name)
+    return os.path.join(settings.PROFILE_DIR, name)
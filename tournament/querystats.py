@@ -0,0 +1,64 @@
+from contextvars import ContextVar
+from time import perf_counter
+
+SLOWEST_QUERIES = 3
+
+# QueryStats of the current request. A context variable, not the connection: under ASGI the queries of a request
+# run in other threads (sync_to_async), which see the variable of the request.
+current_stats = ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    """
+    Execute wrapper (connection.execute_wrapper) which counts the queries, their total time and keeps the slowest.
+    Unlike connection.queries it works with DEBUG = False.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if len(self.slowest) < SLOWEST_QUERIES or duration > self.slowest[-1][0]:
+                self.slowest.append((duration, sql))
+                self.slowest.sort(key=lambda query: query[0], reverse=True)
+                del self.slowest[SLOWEST_QUERIES:]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.duration * 1000, 2),
+            'slowest': [{'ms': round(duration * 1000, 2), 'sql': sql} for duration, sql in self.slowest],
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection (see signals.py): counts the query in the current QueryStats, if any"""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def query_budget(queries):
+    """
+    Declare the most queries a whole request to the view may run, the session, the user and the tournament included.
+    Exceeding it is logged by QueryStatsMiddleware and fails tests.
+    Must be the outermost decorator of the view.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    return getattr(view, 'query_budget', None)
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from collections import defaultdict, namedtuple
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from tournament.models import Game, SetResult
+from tournament.validators import validate_game
+from tournament.standings import refresh_game_summaries, set_score, update_participant
+from tournament.caching import bump_data_version
+from tournament import bracket, events
+
+# One game of an import file: the game is given by its id or by the drawn numbers of the players and the stage
+ResultRow = namedtuple('ResultRow', 'line game id1 id2 game_id sets')
+FORMATS = ('csv', 'jsonl')
+
+
+class ImportReport:
+    def __init__(self):
+        self.errors = []
+        self.games = []
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def __bool__(self):
+        return not self.errors
+
+
+def parse_sets(value):
+    """'11:5 9:11 11:7' -> [(11, 5), (9, 11), (11, 7)]"""
+    sets = []
+    for score in value.replace(',', ' ').split():
+        result1, sep, result2 = score.partition(':')
+        if not sep:
+            raise ValueError("'{}' is not a set score like 11:5".format(score))
+        sets.append((int(result1), int(result2)))
+    return sets
+
+
+def optional_int(value, name):
+    """An integer or a string of one, None if empty; the same for CSV cells and JSON values."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    raise ValueError("{} must be an integer".format(name))
+
+
+def read_csv(text, report):
+    """Columns: game (id) or id1 and id2 (drawn numbers), stage (game_id, 0 by default), sets ('11:5 9:11 ...')."""
+    rows = []
+    reader = csv.DictReader(io.StringIO(text))
+    for record in reader:
+        try:
+            rows.append(ResultRow(reader.line_num, optional_int(record.get('game'), 'game'),
+                                  optional_int(record.get('id1'), 'id1'), optional_int(record.get('id2'), 'id2'),
+                                  optional_int(record.get('stage'), 'stage') or 0,
+                                  parse_sets(record.get('sets') or '')))
+        except ValueError as e:
+            report.error(reader.line_num, str(e))
+    return rows
+
+
+def read_jsonl(text, report):
+    """One object per line: {"game": 12, "sets": [[11, 5], [9, 11], ...]} or {"id1": 3, "id2": 7, "stage": 0, ...}"""
+    rows = []
+    for line, record in enumerate(text.splitlines(), 1):
+        if not record.strip():
+            continue
+        try:
+            record = json.loads(record)
+            rows.append(ResultRow(line, optional_int(record.get('game'), 'game'),
+                                  optional_int(record.get('id1'), 'id1'), optional_int(record.get('id2'), 'id2'),
+                                  optional_int(record.get('stage'), 'stage') or 0,
+                                  [(int(result1), int(result2)) for result1, result2 in record['sets']]))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            report.error(line, "Bad record: {}".format(e))
+    return rows
+
+
+def read_results(text, format, report):
+    return read_csv(text, report) if format == 'csv' else read_jsonl(text, report)
+
+
+def find_games(tournament, rows, report):
+    """Match the rows with the games; a row may list the players in the other order, its sets are then swapped."""
+    games = list(tournament.game_set.select_related('participant1__user', 'participant2__user'))
+    by_id = {game.pk: game for game in games}
+    by_players = {(game.game_id, min(game.id1, game.id2), max(game.id1, game.id2)): game for game in games}
+
+    found = {}
+    for row in rows:
+        if row.game is not None:
+            game = by_id.get(row.game)
+        elif row.id1 is not None and row.id2 is not None:
+            game = by_players.get((row.game_id, min(row.id1, row.id2), max(row.id1, row.id2)))
+        else:
+            report.error(row.line, "Either 'game' or 'id1' and 'id2' must be given")
+            continue
+        if game is None:
+            report.error(row.line, "There is no such game in the tournament")
+            continue
+
+        sets = row.sets
+        if row.game is None and row.id1 == game.id2:
+            sets = [(result2, result1) for result1, result2 in sets]
+        if game.pk in found:
+            report.error(row.line, "{} is already listed on line {}".format(game, found[game.pk][0]))
+        elif game.participant1_id is None or game.participant2_id is None:
+            report.error(row.line, "Participants of {} are not known yet".format(game))
+        elif game.is_played:
+            report.error(row.line, "{} already has results".format(game))
+        else:
+            try:
+                validate_game(sets, game.game_id == 0, tournament.number_of_sets, tournament.number_of_wins)
+            except ValidationError as e:
+                for message in e.messages:
+                    report.error(row.line, "{}: {}".format(game, message))
+                continue
+            found[game.pk] = (row.line, game, sets)
+    return [(game, sets) for line, game, sets in found.values()]
+
+
+def import_results(tournament, text, format='csv', dry_run=False):
+    """
+    Validate all results of the file and, if there are no errors, save them in one transaction.
+    Play-off games can only be imported once their participants are known (after the results of the previous round).
+    """
+    report = ImportReport()
+    games = find_games(tournament, read_results(text, format, report), report)
+    report.games = [game for game, sets in games]
+    if report and not dry_run and games:
+        with transaction.atomic():
+            SetResult.objects.bulk_create([SetResult(game=game, set_number=number, result1=result1, result2=result2)
+                                           for game, sets in games
+                                           for number, (result1, result2) in enumerate(sets, 1)])
+            results_added(tournament, games)
+    return report
+
+
+def results_added(tournament, games):
+    """
+    Bring everything derived from set results up to date after new results of unplayed games were written in bulk,
+    which sends no signals: game summaries, standings, the play-off bracket, result events and cached pages.
+    """
+    refresh_game_summaries(Game.objects.filter(pk__in=[game.pk for game, sets in games]))
+
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for game, sets in games:
+        if game.game_id != 0:
+            continue
+        for participant in (game.participant1_id, game.participant2_id):
+            deltas[participant][2] -= 1
+        for result1, result2 in sets:
+            for participant, (win_sets, win_balls) in zip((game.participant1_id, game.participant2_id),
+                                                          set_score(result1, result2)):
+                deltas[participant][0] += win_sets
+                deltas[participant][1] += win_balls
+    for participant, (win_sets, win_balls, games_left) in deltas.items():
+        update_participant(participant, win_sets, win_balls, games_left)
+
+    if deltas:
+        bracket.seed_quarter_finals(tournament)
+    for game, sets in sorted(games, key=lambda item: item[0].game_id):
+        if game.game_id != 0:
+            bracket.propagate(game)
+    for game, sets in games:
+        events.publish_game_results(game.pk)
+    bump_data_version(tournament.pk)
+
+
+def submit_results(tournament, game, sets, submission):
+    """
+    Save all sets of a game, submitted by one of its players, in one insert.
+    The unique (game, set_number) lets only the first of concurrent or repeated submissions in; returns False
+    if the game already had results from another submission, True if they are the results of this one.
+    """
+    try:
+        with transaction.atomic():
+            SetResult.objects.bulk_create([SetResult(game=game, set_number=number, result1=result1, result2=result2,
+                                                     submission=submission)
+                                           for number, (result1, result2) in enumerate(sets, 1)])
+            results_added(tournament, [(game, sets)])
+    except IntegrityError:
+        # Only the losing submission pays for this query
+        return SetResult.objects.filter(game=game, submission=submission).exists()
+    return True
@@ -0,0 +1,132 @@
+import threading
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from tournament.models import Tournament, Participant, Game, SetResult
+from tournament.functions import forget_cached_tournaments
+from tournament.caching import bump_data_version
+from tournament import standings, bracket, events
+from tournament.querystats import record_query
+from tournament.businessdays import get_calendar
+
+USER_NAME_FIELDS = ('first_name', 'last_name')
+
+_deleting = threading.local()
+
+
+def games_being_deleted():
+    """Ids of the games whose delete is cascading to their set results in this thread."""
+    if not hasattr(_deleting, 'games'):
+        _deleting.games = set()
+    return _deleting.games
+
+
+@receiver(pre_save, sender=SetResult)
+def remember_old_result(sender, instance, raw=False, **kwargs):
+    instance._old_result = None
+    if instance.pk and not raw:
+        old = SetResult.objects.select_related('game').filter(pk=instance.pk).first()
+        if old:
+            instance._old_result = (old.game, old.result1, old.result2)
+
+
+@receiver(post_save, sender=SetResult)
+def set_result_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    games = [instance.game_id]
+    moved_from = None
+    if instance._old_result and instance._old_result[0].pk != instance.game_id:
+        moved_from = instance._old_result[0]
+        games.append(moved_from.pk)
+    standings.refresh_game_summaries(Game.objects.filter(pk__in=games))
+    standings.set_result_saved(instance, instance._old_result)
+    if moved_from:
+        bracket.game_results_changed(moved_from)
+        events.publish_game_results(moved_from.pk)
+    bracket.game_results_changed(instance.game)
+    events.publish_game_results(instance.game_id)
+
+
+@receiver(pre_delete, sender=Game)
+def game_deleting(sender, instance, **kwargs):
+    games_being_deleted().add(instance.pk)
+
+
+@receiver(post_delete, sender=Game)
+def game_deleted(sender, instance, **kwargs):
+    games_being_deleted().discard(instance.pk)
+
+
+@receiver(post_delete, sender=SetResult)
+def set_result_deleted(sender, instance, **kwargs):
+    game = Game.objects.filter(pk=instance.game_id).first()
+    if game is None:
+        return
+    if game.pk in games_being_deleted():
+        # Deleted along with its game (or its tournament): nothing to publish or to move in the bracket,
+        # and an event of the game would break the foreign keys of the cascade
+        standings.set_result_deleted(game, instance.result1, instance.result2, game_deleted=True)
+        return
+    standings.set_result_deleted(game, instance.result1, instance.result2)
+    standings.refresh_game_summaries(Game.objects.filter(pk=game.pk))
+    bracket.game_results_changed(game)
+    events.publish_game_results(game.pk)
+
+
+@receiver(post_save, sender=Tournament)
+@receiver(post_delete, sender=Tournament)
+def tournament_changed(sender, instance, raw=False, **kwargs):
+    forget_cached_tournaments()
+    if not raw:
+        bump_data_version(instance.pk)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def tournament_data_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(instance.tournament_id)
+        # The cached tournaments have the old data version
+        forget_cached_tournaments()
+
+
+@receiver(post_save, sender=SetResult)
+@receiver(post_delete, sender=SetResult)
+def game_data_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(Game.objects.filter(pk=instance.game_id).values('tournament')[:1])
+
+
+@receiver(pre_save, sender=User)
+def remember_old_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._old_name = None
+    # Logins save only last_login
+    if instance.pk and not raw and (update_fields is None or set(update_fields) & set(USER_NAME_FIELDS)):
+        instance._old_name = User.objects.filter(pk=instance.pk).values_list(*USER_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, raw=False, **kwargs):
+    # Names of the participants are shown on the public pages
+    old_name = getattr(instance, '_old_name', None)
+    if old_name is not None and old_name != tuple(getattr(instance, field) for field in USER_NAME_FIELDS):
+        for tournament_id in instance.participant_set.values_list('tournament', flat=True):
+            bump_data_version(tournament_id)
+
+
+@receiver(connection_created)
+def connection_created_handler(sender, connection, **kwargs):
+    # The wrappers outlive reconnects of the connection
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(setting_changed)
+def calendar_setting_changed(setting, **kwargs):
+    if setting in ('BUSINESS_WEEKEND', 'HOLIDAYS_FILE'):
+        get_calendar.cache_clear()
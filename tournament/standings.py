@@ -0,0 +1,75 @@
+from django.db.models import F, Q, Case, When, Value, Count, Sum, Exists, OuterRef, Subquery, SmallIntegerField
+from django.db.models.functions import Coalesce
+from tournament.models import Participant, SetResult
+
+
+def set_score(result1, result2):
+    """Return (win_sets, win_balls) of each side of one set: ((p1_sets, p1_balls), (p2_sets, p2_balls))."""
+    return (int(result1 > result2), result1 - result2), (int(result2 > result1), result2 - result1)
+
+
+def update_participant(participant_id, win_sets=0, win_balls=0, games_left=0):
+    if participant_id is None or not (win_sets or win_balls or games_left):
+        return
+    Participant.objects.filter(pk=participant_id).update(win_sets=F('win_sets') + win_sets,
+                                                         win_balls=F('win_balls') + win_balls,
+                                                         games_left=F('games_left') + games_left)
+
+
+def apply_set_delta(game, result1, result2, sign=1, games_left=0):
+    # Only the group stage counts for the rating
+    if game.game_id != 0:
+        return
+    score1, score2 = set_score(result1, result2)
+    update_participant(game.participant1_id, sign * score1[0], sign * score1[1], games_left)
+    update_participant(game.participant2_id, sign * score2[0], sign * score2[1], games_left)
+
+
+def set_result_saved(result, old=None):
+    """
+    Apply the standings delta of a created or corrected SetResult.
+    `old` is (game, result1, result2) of the row before the update, None for a new row.
+    Must be called inside the transaction which wrote the row.
+    """
+    if old is not None:
+        old_game, old_result1, old_result2 = old
+        if old_game.pk == result.game_id:
+            apply_set_delta(result.game, old_result1, old_result2, sign=-1)
+            apply_set_delta(result.game, result.result1, result.result2)
+            return
+        set_result_deleted(old_game, old_result1, old_result2)
+
+    game = result.game
+    first_set = not game.setresult_set.exclude(pk=result.pk).exists()
+    apply_set_delta(game, result.result1, result.result2, games_left=-1 if first_set else 0)
+
+
+def set_result_deleted(game, result1, result2, game_deleted=False):
+    """
+    Apply the standings delta of a deleted SetResult. `game` must be loaded before its summary is refreshed:
+    when all its sets are deleted at once the game is given back to games_left once, by the first of them.
+    A game which is deleted itself is not given back.
+    """
+    last_set = not game_deleted and game.is_played and not game.setresult_set.exists()
+    apply_set_delta(game, result1, result2, sign=-1, games_left=1 if last_set else 0)
+
+
+def game_results_subquery(aggregate, *filters):
+    results = SetResult.objects.filter(*filters, game=OuterRef('pk')).values('game')
+    return Coalesce(Subquery(results.annotate(value=aggregate).values('value')), 0)
+
+
+def refresh_game_summaries(games):
+    """
+    Recount sets1, sets2, points1, points2, winner and is_played of a queryset of games from their set results.
+    Two UPDATEs whatever the number of games; the queryset must not filter on the summary fields.
+    """
+    games.update(sets1=game_results_subquery(Count('pk'), Q(result1__gt=F('result2'))),
+                 sets2=game_results_subquery(Count('pk'), Q(result2__gt=F('result1'))),
+                 points1=game_results_subquery(Sum('result1')),
+                 points2=game_results_subquery(Sum('result2')),
+                 is_played=Exists(SetResult.objects.filter(game=OuterRef('pk'))))
+    # The participant with more sets wins
+    games.update(winner=Case(When(is_played=True, sets1__gt=F('sets2'), then=Value(1)),
+                             When(is_played=True, then=Value(2)),
+                             default=None, output_field=SmallIntegerField()))
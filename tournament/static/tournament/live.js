@@ -0,0 +1,58 @@
+// Patch the games, play-off and rating pages with the results pushed by the /events/ stream
+(function () {
+    var script = document.currentScript;
+    if (!window.EventSource) {
+        return;
+    }
+
+    function patchGame(game) {
+        var rows = document.querySelectorAll('tr[data-game="' + game.pk + '"]');
+        Array.prototype.forEach.call(rows, function (row) {
+            var side = Number(row.dataset.side);
+            row.querySelector(".player").classList.toggle("text-success", game.winner === side);
+            var sets = row.querySelector(".sets");
+            sets.innerHTML = "";
+            game.sets.forEach(function (result) {
+                var cell = document.createElement("td");
+                cell.style.width = sets.dataset.width;
+                cell.style.border = "0px";
+                cell.textContent = result[side - 1];
+                sets.appendChild(cell);
+            });
+        });
+    }
+
+    function refreshStandings(body) {
+        fetch(script.dataset.standings, {credentials: "same-origin", cache: "no-cache"})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                body.innerHTML = "";
+                data.standings.forEach(function (p) {
+                    var row = document.createElement("tr");
+                    if (p.place <= 8) {
+                        row.className = "bg-success";
+                    }
+                    var place = document.createElement("th");
+                    place.scope = "row";
+                    place.textContent = p.place;
+                    row.appendChild(place);
+                    [p.first_name, p.last_name, p.sets_won, p.ball_difference, p.games_remaining].forEach(function (value) {
+                        var cell = document.createElement("td");
+                        cell.textContent = value;
+                        row.appendChild(cell);
+                    });
+                    body.appendChild(row);
+                });
+            });
+    }
+
+    var source = new EventSource(script.dataset.events);
+    source.addEventListener("result", function (event) {
+        var data = JSON.parse(event.data);
+        patchGame(data.game);
+        var standings = document.getElementById("standings");
+        if (standings) {
+            refreshStandings(standings);
+        }
+    });
+})();
@@ -0,0 +1,40 @@
+import gzip
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+# Text files worth compressing; images and fonts are compressed already
+GZIP_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml', '.map', '.ico', '.ttf', '.otf', '.eot')
+GZIP_MIN_SIZE = 256
+# A .gz which saves less than this is not worth its decompression
+GZIP_MIN_RATIO = 0.95
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic writes the files under content-hashed names (served with far-future expiry, see ping/nginx.conf)
+    and a .gz beside each hashed text file for nginx gzip_static.
+    Before the first collectstatic (development, tests) {% static %} gives the plain names.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in sorted(set(self.hashed_files.values())):
+                if name.endswith(GZIP_EXTENSIONS):
+                    self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < GZIP_MIN_SIZE:
+            return
+        # mtime=0: the same file always gives the same .gz
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) > len(content) * GZIP_MIN_RATIO:
+            return
+        with open(self.path(name) + '.gz', 'wb') as f:
+            f.write(compressed)
@@ -0,0 +1,13 @@
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def tournament_url(context, name, *args):
+    """{% url %} for the pages of a tournament which keeps the /t/<tournament_id>/ prefix of the current page."""
+    request = context['request']
+    if getattr(request, 'tournament_scoped', False):
+        return reverse('t:' + name, args=(request.tournament.pk,) + args)
+    return reverse(name, args=args)
@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from openpyxl import load_workbook
+from django.contrib.auth.models import User
+from django.db import connection, IntegrityError, OperationalError
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, resolve, URLResolver
+from unittest import mock
+from django.utils import timezone
+from tournament.models import DrawJob, Game, SetResult, ResultEvent, Tournament
+from tournament.events import last_event_id, new_events
+from tournament.results import import_results, submit_results
+from tournament.validators import validate_set
+from tournament.standings import refresh_game_summaries
+from tournament.factories import create_tournament
+from tournament.functions import (export_schedule, forget_cached_tournaments, generate_pairs, get_dates, get_tournament,
+                                  run_draw, schedule_pairs, split_into_rounds)
+from tournament.businessdays import BusinessCalendar
+from tournament.querystats import get_query_budget
+from tournament.jobs import enqueue_draw, run_next_job
+from tournament import events, views, transactions
+from tournament.asgi import ASGIHandler
 
-# Create your tests here.
+
+class StandingsAssertions:
+    def assertStandingsMatchRecount(self, tournament):
+        """The standings kept up to date on every result change equal the ones counted from the results."""
+        stored = {p.pk: (p.win_sets, p.win_balls, p.games_left) for p in tournament.participant_set.all()}
+        recounted = {row['pk']: (row['sets_won'], row['ball_difference'], row['games_remaining'])
+                     for row in tournament.standings()}
+        self.assertEqual(stored, recounted)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PublicPagesTestCase(TestCase):
+    pages = ('/participants/', '/games/', '/rating/', '/playoff/')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertWithinQueryBudget(self, path, data=None, method='get'):
+        """Request the view with cold caches and fail if it runs more queries than its @query_budget."""
+        budget = get_query_budget(resolve(path).func)
+        self.assertIsNotNone(budget, "{} has no query budget".format(path))
+        cache.clear()
+        forget_cached_tournaments()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data)
+        self.assertLessEqual(len(context), budget, "{} {} ran {} queries over its budget of {}:\n{}".format(
+            method.upper(), path, len(context), budget, "\n".join(query['sql'] for query in context)))
+        return response
+
+
+class PublicPagesQueriesTest(PublicPagesTestCase):
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_queries_do_not_depend_on_the_number_of_participants(self):
+        create_tournament(8)
+        small = {path: self.count_queries(path) for path in self.pages}
+        create_tournament(32)
+        large = {path: self.count_queries(path) for path in self.pages}
+        self.assertEqual(small, large)
+
+    def test_query_budget(self):
+        create_tournament(16)
+        # The current tournament comes from the process cache after the first request;
+        # the data version is read on every request and base.html counts the participants
+        self.client.get('/')
+        budget = {'/participants/': 3, '/games/': 4, '/rating/': 3, '/playoff/': 4}
+        for path, queries in budget.items():
+            with self.subTest(path=path), self.assertNumQueries(queries):
+                self.client.get(path)
+
+
+class PublicPagesCacheTest(PublicPagesTestCase):
+    def test_cached_page_costs_one_query(self):
+        create_tournament(8)
+        for path in self.pages:
+            first = self.client.get(path)
+            with self.subTest(path=path), self.assertNumQueries(1):
+                second = self.client.get(path)
+            self.assertEqual(first.content, second.content)
+
+    def test_conditional_get(self):
+        tournament = create_tournament(8)
+        response = self.client.get('/rating/')
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get('/rating/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        game = tournament.game_set.filter(game_id=0, is_played=False).first()
+        SetResult(game=game, set_number=1, result1=11, result2=0).save()
+        changed = self.client.get('/rating/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertNotEqual(changed.content, response.content)
+
+
+class TournamentCacheTest(TestCase):
+    def test_saves_invalidate_the_cached_tournament(self):
+        tournament = create_tournament(8, played=0)
+        forget_cached_tournaments()
+        for instance in (tournament, tournament.participant_set.first(), tournament.game_set.first()):
+            get_tournament(tournament.pk)
+            with self.assertNumQueries(0):
+                get_tournament(tournament.pk)
+            instance.save()
+            with self.assertNumQueries(1):
+                cached = get_tournament(tournament.pk)
+            tournament.refresh_from_db()
+            self.assertEqual(cached.data_version, tournament.data_version)
+
+
+class DataVersionTest(PublicPagesTestCase):
+    def data_version(self, tournament):
+        tournament.refresh_from_db()
+        return tournament.data_version
+
+    def test_only_name_changes_of_users_invalidate_pages(self):
+        tournament = create_tournament(8)
+        user = tournament.participant_set.select_related('user').first().user
+        version = self.data_version(tournament)
+        self.client.force_login(user)
+        user.email = 'player@example.com'
+        user.save()
+        self.assertEqual(self.data_version(tournament), version)
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertEqual(self.data_version(tournament), version + 1)
+
+
+class ApiTest(PublicPagesTestCase):
+    def test_schedule_filters_and_pages(self):
+        tournament = create_tournament(8)
+        participant = tournament.participant_set.first()
+        response = self.client.get('/api/schedule/', {'participant': participant.pk, 'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], tournament.game_set.filter(Q(participant1=participant) |
+                                                                   Q(participant2=participant)).count())
+        self.assertEqual(len(data['games']), 3)
+        for game in data['games']:
+            self.assertIn(participant.pk, (game['participant1'], game['participant2']))
+
+        day = data['games'][0]['game_date']
+        games = self.client.get('/api/schedule/', {'day': day}).json()['games']
+        self.assertEqual({game['game_date'] for game in games}, {day})
+        self.assertEqual(self.client.get('/api/schedule/', {'day': 'tomorrow'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/schedule/', {'page': 100}).status_code, 400)
+
+    def test_standings_and_bracket(self):
+        tournament = create_tournament(8)
+        standings = self.client.get('/api/standings/').json()['standings']
+        self.assertEqual([row['place'] for row in standings], list(range(1, 9)))
+        self.assertEqual(standings[0]['pk'], tournament.standings()[0]['pk'])
+        bracket = self.client.get('/api/bracket/').json()['games']
+        self.assertEqual([game['game_id'] for game in bracket], list(range(1, 9)))
+        self.assertIsNone(bracket[-1]['participant1_name'])
+
+    def test_polling_is_cheap(self):
+        create_tournament(8)
+        response = self.client.get('/api/status/')
+        self.assertEqual(response.json()['status'], 'group_stage')
+        self.assertIn('max-age', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            not_modified = self.client.get('/api/status/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class TournamentScopedPagesTest(PublicPagesTestCase):
+    def test_pages_of_an_older_tournament(self):
+        old = create_tournament(8)
+        current = create_tournament(10)
+        root = '/t/{}/'.format(old.pk)
+        for path in self.pages:
+            with self.subTest(path=path):
+                response = self.client.get(root + path.lstrip('/'))
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'href="{}games/"'.format(root))
+        self.assertEqual(len(self.client.get(root + 'api/standings/').json()['standings']), 8)
+        self.assertEqual(len(self.client.get('/api/standings/').json()['standings']), 10)
+        self.assertEqual(self.client.get(root + 'api/status/').json()['id'], old.pk)
+        self.assertEqual(self.client.get('/t/{}/games/'.format(current.pk + 1)).status_code, 404)
+        self.assertContains(self.client.get('/t/'), 'href="{}"'.format(root))
+
+
+class ResultEventsTest(TestCase):
+    def test_one_event_per_submitted_game(self):
+        tournament = create_tournament(8, played=0)
+        after = last_event_id(tournament)
+        game = tournament.game_set.filter(game_id=0).first()
+        with transaction.atomic():
+            for set_number in range(1, 6):
+                SetResult(game=game, set_number=set_number, result1=11, result2=set_number).save()
+
+        events, last = new_events(tournament, after)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][0], last)
+        data = json.loads(events[0][1])
+        self.assertEqual((data['game']['pk'], data['game']['sets1'], data['game']['winner']), (game.pk, 5, 1))
+        self.assertEqual(len(data['game']['sets']), 5)
+        self.assertEqual({row['pk'] for row in data['standings']}, {game.participant1_id, game.participant2_id})
+
+
+class StandingsTest(StandingsAssertions, TestCase):
+    def test_deleting_all_sets_of_a_game_at_once(self):
+        tournament = create_tournament(8, played=0.5)
+        game = tournament.game_set.filter(game_id=0, is_played=True).first()
+        game.setresult_set.all().delete()
+        game.refresh_from_db()
+        self.assertFalse(game.is_played)
+        self.assertStandingsMatchRecount(tournament)
+
+        SetResult.objects.filter(game__tournament=tournament).delete()
+        self.assertStandingsMatchRecount(tournament)
+
+
+    def test_standings_search_the_games_of_each_participant(self):
+        tournament = create_tournament(16)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(tournament.standings())), 16)
+        sql, params = tournament.standings().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        # The games of a participant are found by participant1 or participant2, not among all the games
+        self.assertEqual([step for step in plan if step.startswith('SCAN') or 'game_schedule_idx' in step], [])
+
+
+class GameSummaryTest(TestCase):
+    def test_summaries_follow_the_sets(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).first()
+        for number, (result1, result2) in enumerate([(11, 5), (9, 11), (11, 7)], 1):
+            SetResult(game=game, set_number=number, result1=result1, result2=result2).save()
+        game.refresh_from_db()
+        self.assertEqual((game.sets1, game.sets2, game.points1, game.points2, game.winner, game.is_played),
+                         (2, 1, 31, 23, 1, True))
+        game.setresult_set.all().delete()
+        game.refresh_from_db()
+        self.assertEqual((game.sets1, game.sets2, game.points1, game.points2, game.winner, game.is_played),
+                         (0, 0, 0, 0, None, False))
+
+    def test_refresh_game_summaries(self):
+        tournament = create_tournament(8, played=0.5)
+        games = tournament.game_set.all()
+        stored = list(games.order_by('pk').values_list('sets1', 'sets2', 'points1', 'points2', 'winner', 'is_played'))
+        games.update(sets1=0, sets2=0, points1=0, points2=0, winner=None, is_played=False)
+        refresh_game_summaries(games)
+        self.assertEqual(list(games.order_by('pk').values_list('sets1', 'sets2', 'points1', 'points2', 'winner',
+                                                               'is_played')), stored)
+
+    def test_rebuild_game_summaries(self):
+        tournament = create_tournament(8, played=0.5)
+        game = tournament.game_set.filter(game_id=0, is_played=True).first()
+        Game.objects.filter(pk=game.pk).update(sets1=F('sets1') + 1)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "Summaries of 1 game(s) drifted"):
+            call_command('rebuild_game_summaries', '--tournament', tournament.pk, '--check', stdout=out)
+        self.assertIn("sets1 {} -> {}".format(game.sets1 + 1, game.sets1), out.getvalue())
+        call_command('rebuild_game_summaries', '--tournament', tournament.pk, stdout=out)
+        self.assertEqual(Game.objects.get(pk=game.pk).sets1, game.sets1)
+        call_command('rebuild_game_summaries', '--tournament', tournament.pk, '--check', stdout=out)
+        self.assertTrue(out.getvalue().endswith("Game summaries are consistent\n"))
+
+
+class RebuildStandingsTest(TestCase):
+    def rebuild(self, tournament, *options):
+        out = io.StringIO()
+        call_command('rebuild_standings', '--tournament', tournament.pk, *options, stdout=out)
+        return out.getvalue()
+
+    def test_kept_standings_match_the_rebuild(self):
+        tournament = create_tournament(8, played=0.5)
+        game = tournament.game_set.filter(game_id=0, is_played=False).first()
+        SetResult(game=game, set_number=1, result1=11, result2=7).save()
+        self.assertIn("Standings are consistent", self.rebuild(tournament, '--check'))
+        tournament.game_set.filter(game_id=0, is_played=True).first().setresult_set.first().delete()
+        self.assertIn("Standings are consistent", self.rebuild(tournament, '--check'))
+
+    def test_tournament_option(self):
+        tournament = create_tournament(8, played=0)
+        forget_cached_tournaments()
+        for command in ('rebuild_standings', 'rebuild_game_summaries'):
+            with self.assertRaisesMessage(CommandError, "Tournament {} does not exist".format(tournament.pk + 1)):
+                call_command(command, '--tournament', tournament.pk + 1, stdout=io.StringIO())
+            # The current tournament by default
+            call_command(command, '--check', stdout=io.StringIO())
+
+    def test_drift_is_reported_and_fixed(self):
+        tournament = create_tournament(8, played=0.5)
+        participant = tournament.participant_set.first()
+        tournament.participant_set.filter(pk=participant.pk).update(win_sets=F('win_sets') + 3)
+        with self.assertRaisesMessage(CommandError, "Standings of 1 participant(s) drifted"):
+            self.rebuild(tournament, '--check')
+        self.assertEqual(tournament.participant_set.get(pk=participant.pk).win_sets, participant.win_sets + 3)
+        self.assertIn("Fixed standings of 1 participant(s)", self.rebuild(tournament))
+        self.assertEqual(tournament.participant_set.get(pk=participant.pk).win_sets, participant.win_sets)
+        self.assertIn("Standings are consistent", self.rebuild(tournament, '--check'))
+
+
+class DeleteTest(StandingsAssertions, TestCase):
+    def test_delete_a_tournament_with_results(self):
+        tournament = create_tournament(8, played=0.5)
+        other = create_tournament(8, played=0.5)
+        after = last_event_id(other)
+        tournament.delete()
+        self.assertFalse(SetResult.objects.filter(game__tournament=tournament.pk).exists())
+        self.assertEqual(new_events(other, after), ([], after))
+
+    def test_delete_a_played_game(self):
+        tournament = create_tournament(8, played=0.5)
+        after = last_event_id(tournament)
+        tournament.game_set.filter(game_id=0, is_played=True).first().delete()
+        self.assertEqual(new_events(tournament, after), ([], after))
+        self.assertStandingsMatchRecount(tournament)
+
+
+class BracketTest(TestCase):
+    def play(self, game, winner):
+        score = (11, 5) if winner == 1 else (5, 11)
+        for set_number in range(1, game.tournament.number_of_wins + 1):
+            SetResult(game=game, set_number=set_number, result1=score[0], result2=score[1]).save()
+
+    def test_winners_advance_and_are_taken_back(self):
+        tournament = create_tournament(16, played=1)
+        playoff = {game.game_id: game for game in tournament.game_set.exclude(game_id=0)}
+        self.assertTrue(all(playoff[i].participant1_id and playoff[i].participant2_id for i in (1, 2, 3, 4)))
+
+        self.play(playoff[1], 1)
+        submit_results(tournament, playoff[4], [(5, 11)] * tournament.number_of_wins,
+                       '8f14e45f-ceea-467f-a8f5-8e7a5f3e9d0c')
+        semi_final = tournament.game_set.get(game_id=5)
+        self.assertEqual((semi_final.participant1_id, semi_final.participant2_id),
+                         (playoff[1].participant1_id, playoff[4].participant2_id))
+
+        self.play(semi_final, 2)
+        final, third_place = tournament.game_set.get(game_id=8), tournament.game_set.get(game_id=7)
+        self.assertEqual(final.participant1_id, playoff[4].participant2_id)
+        self.assertEqual(third_place.participant1_id, playoff[1].participant1_id)
+
+        playoff[1].setresult_set.all().delete()
+        semi_final.refresh_from_db()
+        self.assertEqual((semi_final.participant1_id, semi_final.participant2_id),
+                         (None, playoff[4].participant2_id))
+
+
+    def test_a_corrected_result_reaches_the_played_games_after_it(self):
+        tournament = create_tournament(16, played=1)
+        playoff = {game.game_id: game for game in tournament.game_set.exclude(game_id=0)}
+        self.play(playoff[1], 1)
+        self.play(playoff[4], 1)
+        self.play(tournament.game_set.get(game_id=5), 1)
+        self.assertEqual(tournament.game_set.get(game_id=8).participant1_id, playoff[1].participant1_id)
+
+        # The second player of the quarter final has won in fact
+        for result in playoff[1].setresult_set.all():
+            result.result1, result.result2 = result.result2, result.result1
+            result.save()
+        final, third_place = tournament.game_set.get(game_id=8), tournament.game_set.get(game_id=7)
+        self.assertEqual(final.participant1_id, playoff[1].participant2_id)
+        self.assertEqual(third_place.participant1_id, playoff[4].participant1_id)
+
+    def test_quarter_finals_are_seeded_by_the_kept_standings(self):
+        tournament = create_tournament(16, played=0.5)
+        game = tournament.game_set.filter(game_id=0, is_played=False).first()
+        with mock.patch.object(Tournament, 'standings', side_effect=AssertionError("the standings are recounted")):
+            submit_results(tournament, game, [(11, 5)] * 5, '8f14e45f-ceea-467f-a8f5-8e7a5f3e9d0c')
+        top = [row['pk'] for row in tournament.standings()[:8]]
+        quarter_finals = tournament.game_set.filter(game_id__in=(1, 2, 3, 4)).order_by('game_id')
+        self.assertEqual([(game.participant1_id, game.participant2_id) for game in quarter_finals],
+                         [(top[i - 1], top[8 - i]) for i in (1, 2, 3, 4)])
+
+
+class GameTest(TestCase):
+    def test_a_pair_plays_once_at_each_stage(self):
+        tournament = create_tournament(8, played=0)
+        # Not the pair of the first quarter final
+        game = tournament.game_set.filter(game_id=0).exclude(low_number=1, high_number=8).first()
+        reversed_pair = Game(tournament=tournament, id1=game.id2, id2=game.id1)
+        with self.assertRaisesMessage(ValidationError, "Duplicate game"):
+            reversed_pair.save()
+        reversed_pair.order_pair()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Game.objects.bulk_create([reversed_pair])
+        # The same pair in the play-off is another game
+        Game(tournament=tournament, game_id=1, id1=game.id2, id2=game.id1).save()
+
+    def test_other_integrity_errors_are_not_duplicates(self):
+        tournament = create_tournament(8, played=0)
+        with self.assertRaises(IntegrityError):
+            Game(tournament=tournament, game_id=0, id1=3, id2=3).save(first_call=False)
+        unordered = Game(tournament=tournament, game_id=0, id1=1, id2=9, low_number=9, high_number=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Game.objects.bulk_create([unordered])
+
+
+class DrawTest(TestCase):
+    def assertLinked(self, tournament):
+        numbers = dict(tournament.participant_set.values_list('pk', 'drawn_number'))
+        self.assertEqual(sorted(numbers.values()), list(range(1, len(numbers) + 1)))
+        games_left = Counter()
+        for game in tournament.game_set.filter(game_id=0):
+            self.assertEqual((numbers[game.participant1_id], numbers[game.participant2_id]), (game.id1, game.id2))
+            games_left.update((game.participant1_id, game.participant2_id))
+        self.assertEqual(dict(tournament.participant_set.values_list('pk', 'games_left')), dict(games_left))
+        self.assertFalse(tournament.participant_set.filter(initialized=False).exists())
+
+    def test_numbers_before_or_after_the_games(self):
+        # create_tournament draws the numbers, then saves the games
+        tournament = create_tournament(8, played=0)
+        self.assertLinked(tournament)
+        numbers = list(tournament.participant_set.order_by('pk').values_list('drawn_number', flat=True))
+        run_draw(tournament, seed=2)
+        self.assertLinked(tournament)
+        self.assertNotEqual(list(tournament.participant_set.order_by('pk').values_list('drawn_number', flat=True)),
+                            numbers)
+
+    def test_play_off_games_are_not_linked_by_drawn_number(self):
+        tournament = create_tournament(8, played=0)
+        run_draw(tournament, seed=2)
+        # Their id1 and id2 are places of the group stage or the previous round
+        self.assertFalse(tournament.game_set.exclude(game_id=0).filter(
+            Q(participant1__isnull=False) | Q(participant2__isnull=False)).exists())
+
+    def test_no_redraw_after_the_first_result(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).first()
+        SetResult(game=game, set_number=1, result1=11, result2=3).save()
+        numbers = dict(tournament.participant_set.values_list('pk', 'drawn_number'))
+        with self.assertRaisesMessage(ValidationError, "The draw cannot be changed after the first result"):
+            run_draw(tournament, seed=2)
+        self.assertEqual(dict(tournament.participant_set.values_list('pk', 'drawn_number')), numbers)
+
+
+class DrawJobTest(TestCase):
+    def test_one_queued_or_running_draw_per_tournament(self):
+        tournament = create_tournament(8, played=0)
+        job = enqueue_draw(tournament)
+        self.assertEqual(enqueue_draw(tournament), job)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DrawJob.objects.create(tournament=tournament, status=DrawJob.RUNNING)
+
+        job.status = DrawJob.FAILED
+        job.save()
+        self.assertNotEqual(enqueue_draw(tournament), job)
+
+    def test_run_next_job(self):
+        tournament = create_tournament(8, played=0)
+        tournament.game_set.all().delete()
+        job = enqueue_draw(tournament)
+        self.assertEqual(run_next_job().pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DrawJob.DONE)
+        self.assertEqual(tournament.game_set.filter(game_id=0).count(), 8 * 4 // 2)
+        self.assertIsNone(run_next_job())
+
+    def test_a_draw_which_does_not_fit_fails_at_once(self):
+        tournament = create_tournament(8, played=0)
+        tournament.game_set.all().delete()
+        Tournament.objects.filter(pk=tournament.pk).update(game_end_time=time(9, 20))
+        job = enqueue_draw(tournament)
+        run_next_job()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (DrawJob.FAILED, 1))
+        self.assertIn("does not fit", job.message)
+        self.assertFalse(tournament.game_set.exists())
+
+
+class SubmitResultsTest(TestCase):
+    def test_repeated_submission_is_saved_once(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).select_related('participant1__user').first()
+        self.client.force_login(game.participant1.user)
+        data = {'submission': '8f14e45f-ceea-467f-a8f5-8e7a5f3e9d0c'}
+        for i in range(1, 6):
+            data['set{}res1'.format(i)], data['set{}res2'.format(i)] = 11, i
+        for _ in range(2):
+            response = self.client.post('/accounts/me/games/{}/'.format(game.pk), data)
+            self.assertRedirects(response, '/accounts/me/games/', fetch_redirect_response=False)
+        self.assertEqual(SetResult.objects.filter(game=game).count(), 5)
+        self.assertEqual(ResultEvent.objects.filter(game=game).count(), 1)
+
+    def test_only_the_first_submission_wins(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).first()
+        first, second = '8f14e45f-ceea-467f-a8f5-8e7a5f3e9d0c', 'c9f0f895-fb98-4b91-b5c3-6d2d8c4d7a1e'
+        self.assertTrue(submit_results(tournament, game, [(11, 5)] * 5, first))
+        self.assertFalse(submit_results(tournament, game, [(5, 11)] * 5, second))
+        self.assertTrue(submit_results(tournament, game, [(11, 5)] * 5, first))
+        game.refresh_from_db()
+        self.assertEqual((game.sets1, game.sets2, game.winner), (5, 0, 1))
+        self.assertEqual(tournament.participant_set.get(pk=game.participant1_id).win_sets, 5)
+
+
+class ImportResultsTest(StandingsAssertions, TestCase):
+    def test_import_is_all_or_nothing(self):
+        tournament = create_tournament(8, played=0)
+        games = list(tournament.game_set.filter(game_id=0).order_by('pk'))
+        rows = ['game,id1,id2,stage,sets'] + ['{},,,,11:5 9:11 11:7 11:4 11:9'.format(game.pk) for game in games[:6]]
+        # The players may be listed in the other order
+        rows.append(',{},{},0,5:11 11:9 7:11 4:11 9:11'.format(games[6].id2, games[6].id1))
+
+        report = import_results(tournament, '\n'.join(rows + ['{},,,,11:5 12:5'.format(games[7].pk)]))
+        self.assertEqual([line for line, message in report.errors], [9])
+        self.assertFalse(SetResult.objects.exists())
+        self.assertTrue(import_results(tournament, '\n'.join(rows), dry_run=True))
+        self.assertFalse(SetResult.objects.exists())
+
+        self.assertTrue(import_results(tournament, '\n'.join(rows)))
+        self.assertEqual(SetResult.objects.count(), 35)
+        self.assertEqual(tournament.game_set.get(pk=games[6].pk).winner, 1)
+        self.assertStandingsMatchRecount(tournament)
+        self.assertEqual(len(import_results(tournament, '\n'.join(rows)).errors), 7)
+
+    def test_jsonl_numbers(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).first()
+        sets = [[11, 5]] * 5
+        report = import_results(tournament, '\n'.join([json.dumps({'game': 'x', 'sets': sets}),
+                                                       json.dumps({'game': 1.5, 'sets': sets})]), format='jsonl')
+        self.assertEqual(report.errors, [(1, "Bad record: game must be an integer"),
+                                         (2, "Bad record: game must be an integer")])
+        self.assertTrue(import_results(tournament, json.dumps({'game': str(game.pk), 'sets': sets}), format='jsonl'))
+        self.assertEqual(SetResult.objects.filter(game=game).count(), 5)
+
+
+class GeneratePairsTest(SimpleTestCase):
+    def test_everybody_gets_games_per_person_different_opponents(self):
+        for participants, games_per_person in ((8, 4), (8, 10), (9, 4), (9, 5), (16, 10), (33, 6)):
+            pairs = generate_pairs(participants, games_per_person, seed=7)
+            games = min(games_per_person, participants - 1)
+            if participants % 2:
+                games -= games % 2
+            self.assertTrue(all(id1 < id2 for id1, id2 in pairs))
+            self.assertEqual(len(set(pairs)), len(pairs))
+            self.assertEqual(Counter(player for pair in pairs for player in pair),
+                             {player: games for player in range(1, participants + 1)})
+
+    def test_rounds(self):
+        for participants in (9, 16, 17):
+            rounds = split_into_rounds(generate_pairs(participants, 6, seed=5))
+            self.assertLessEqual(len(rounds), 7)
+            for games in rounds:
+                players = [player for pair in games for player in pair]
+                self.assertEqual(len(players), len(set(players)))
+
+    def test_same_seed_same_pairs(self):
+        self.assertEqual(generate_pairs(16, 6, seed=3), generate_pairs(16, 6, seed=3))
+        self.assertNotEqual(generate_pairs(16, 6, seed=3), generate_pairs(16, 6, seed=4))
+        self.assertEqual(generate_pairs(1, 6), [])
+
+    def test_seed_changes_the_opponents_in_an_odd_field(self):
+        def triangles(pairs):
+            opponents = {}
+            for id1, id2 in pairs:
+                opponents.setdefault(id1, set()).add(id2)
+                opponents.setdefault(id2, set()).add(id1)
+            return sum(len(opponents[id1] & opponents[id2]) for id1, id2 in pairs) // 3
+        # Not only the numbers are shuffled: the graphs are not the same
+        self.assertGreater(len({triangles(generate_pairs(17, 4, seed)) for seed in range(10)}), 1)
+
+
+class SchedulePairsTest(SimpleTestCase):
+    days = [date(2026, 11, 2), date(2026, 11, 3), date(2026, 11, 5)]
+
+    def schedule(self, pairs, **kwargs):
+        return schedule_pairs(pairs, self.days, time(9), timedelta(minutes=30), **kwargs)
+
+    def test_games_a_day_are_limited_by_tables_and_end_time(self):
+        pairs = [(i, i + 1) for i in range(1, 20, 2)]
+        slots, unplaced = self.schedule(pairs, tables=2, end_time=time(10))
+        self.assertEqual(unplaced, [])
+        per_day = Counter(day for day, start in slots)
+        self.assertEqual([per_day[day] for day in self.days], [4, 4, 2])
+        self.assertEqual([start for day, start in slots[:4]], [time(9), time(9), time(9, 30), time(9, 30)])
+
+    def test_one_game_a_day_for_each_player(self):
+        pairs = [(1, 2), (1, 3), (2, 3), (3, 4), (1, 4)]
+        slots, unplaced = self.schedule(pairs, tables=4)
+        self.assertEqual(unplaced, [])
+        for day in self.days:
+            players = [player for pair, slot in zip(pairs, slots) if slot[0] == day for player in pair]
+            self.assertEqual(len(players), len(set(players)))
+
+    @mock.patch.object(timezone, 'now', lambda: datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc))
+    def test_the_shortest_group_stage_fits_every_field(self):
+        tournament = Tournament(reg_end=datetime(2026, 3, 3, tzinfo=dt_timezone.utc),
+                                draw_time=datetime(2026, 3, 4, tzinfo=dt_timezone.utc),
+                                start_date=date(2026, 3, 10), start_date_playoff=date(2026, 3, 25),
+                                end_date=date(2026, 3, 27), games_per_person=10)
+        tournament.clean()
+        days = get_dates(tournament)
+        self.assertEqual(len(days), 11)
+        for participants in (12, 15, 16, 17, 21, 22, 33):
+            for seed in (1, 2):
+                pairs = generate_pairs(participants, tournament.games_per_person, seed)
+                slots, unplaced = schedule_pairs(pairs, days, time(11), timedelta(minutes=30), tables=participants)
+                self.assertEqual(unplaced, [], (participants, seed))
+
+    def test_unplaced_pairs_are_reported(self):
+        pairs = [(1, 2), (1, 3), (1, 4), (1, 5)]
+        slots, unplaced = self.schedule(pairs, tables=4)
+        self.assertEqual(slots[3], None)
+        self.assertEqual(unplaced, [((1, 5), "players #1 and #5 have no common free day")])
+
+        slots, unplaced = self.schedule(pairs, tables=1, end_time=time(9, 20))
+        self.assertEqual(slots, [None] * 4)
+        self.assertEqual([pair for pair, reason in unplaced], pairs)
+        self.assertIn("does not fit", unplaced[0][1])
+
+
+class BusinessCalendarTest(SimpleTestCase):
+    def test_add_and_count(self):
+        calendar = BusinessCalendar(holidays=[date(2026, 11, 4)])
+        self.assertEqual(calendar.add(date(2026, 10, 30), 1), date(2026, 11, 2))
+        self.assertEqual(calendar.add(date(2026, 10, 31), 1), date(2026, 11, 2))
+        self.assertEqual(calendar.add(date(2026, 11, 3), 1), date(2026, 11, 5))
+        self.assertEqual(calendar.add(date(2026, 11, 4), 0), date(2026, 11, 5))
+        self.assertEqual(calendar.add(date(2026, 11, 5), -1), date(2026, 11, 3))
+        self.assertEqual(calendar.count(date(2026, 11, 2), date(2026, 11, 9)), 4)
+
+    def test_matches_day_by_day(self):
+        holidays = {date(2026, 1, 1) + timedelta(days=days) for days in range(0, 700, 37)}
+        calendar = BusinessCalendar(weekend=(4, 5), holidays=holidays)
+        start = date(2025, 12, 1)
+        days = [start + timedelta(days=i) for i in range(800)]
+        business = [day for day in days if day.weekday() not in (4, 5) and day not in holidays]
+        self.assertEqual(calendar.business_days(start, start + timedelta(days=800)), business)
+        for day in days[:60]:
+            following = [b for b in business if b > day]
+            self.assertEqual(calendar.add(day, 1), following[0])
+            self.assertEqual(calendar.add(day, 100), following[99])
+            self.assertEqual(calendar.is_business_day(day), day in business)
+
+    def test_group_stage_days_skip_holidays(self):
+        tournament = Tournament(start_date=date(2026, 11, 2), start_date_playoff=date(2026, 11, 9))
+        self.assertEqual(get_dates(tournament), [date(2026, 11, 2), date(2026, 11, 3), date(2026, 11, 5),
+                                                 date(2026, 11, 6)])
+        with self.settings(BUSINESS_WEEKEND=(6,), HOLIDAYS_FILE=None):
+            self.assertEqual(len(get_dates(tournament)), 6)
+
+    @mock.patch.object(timezone, 'now', lambda: datetime(2026, 10, 18, 12, tzinfo=dt_timezone.utc))
+    def test_date_validation(self):
+        tournament = Tournament(reg_end=datetime(2026, 10, 19, tzinfo=dt_timezone.utc),
+                                draw_time=datetime(2026, 10, 20, tzinfo=dt_timezone.utc),
+                                start_date=date(2026, 10, 26), start_date_playoff=date(2026, 10, 30),
+                                end_date=date(2026, 11, 5), games_per_person=4)
+        with self.assertRaises(ValidationError):
+            tournament.clean()
+        # 5 business days after Monday
+        tournament.start_date_playoff = date(2026, 11, 2)
+        tournament.clean()
+        # November 4 is a holiday
+        tournament.start_date_playoff = date(2026, 11, 3)
+        with self.assertRaises(ValidationError):
+            tournament.clean()
+        tournament.end_date = date(2026, 11, 6)
+        tournament.clean()
+
+    def test_pandas_is_not_imported(self):
+        code = "import sys, django; django.setup(); import tournament.views, tournament.admin; print(list(sys.modules))"
+        modules = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                 check=True, env=dict(os.environ, DJANGO_SETTINGS_MODULE='ping.settings')).stdout
+        self.assertNotIn("'pandas'", modules)
+
+
+class FactoryTest(StandingsAssertions, TestCase):
+    def test_results_are_valid_and_counted(self):
+        tournament = create_tournament(33, played=1, games_per_person=6)
+        games = tournament.game_set.filter(game_id=0)
+        # An odd field: every player has an even number of games
+        self.assertEqual(games.count(), 33 * 6 // 2)
+        self.assertFalse(games.filter(is_played=False).exists())
+        for result in SetResult.objects.all():
+            validate_set(result.result1, result.result2)
+        self.assertStandingsMatchRecount(tournament)
+        self.assertEqual(tournament.game_set.filter(game_id=1, participant1__isnull=False).count(), 1)
+
+
+def tournament_views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from tournament_views(pattern.url_patterns)
+        elif pattern.callback.__module__ in ('tournament.views', 'tournament.api'):
+            yield pattern
+
+
+class QueryBudgetTest(PublicPagesTestCase):
+    def test_every_view_has_a_budget(self):
+        for pattern in tournament_views(get_resolver().url_patterns):
+            with self.subTest(view=pattern.name):
+                self.assertIsNotNone(get_query_budget(pattern.callback))
+
+    def test_views_are_within_budget(self):
+        tournament = create_tournament(32)
+        user = tournament.participant_set.first().user
+        game = tournament.game_set.filter(Q(participant1__user=user) | Q(participant2__user=user),
+                                          is_played=False).first()
+        paths = ['/', '/t/', '/participants/', '/games/', '/games/schedule.xlsx', '/rating/', '/playoff/',
+                 '/api/status/', '/api/schedule/', '/api/standings/', '/api/bracket/', '/accounts/login/',
+                 '/accounts/register/']
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertWithinQueryBudget(path)
+
+        self.client.force_login(user)
+        for path in paths[:7] + ['/accounts/me/', '/accounts/me/games/']:
+            with self.subTest(path=path, user=user.username):
+                self.assertWithinQueryBudget(path)
+        data = {}
+        for i in range(1, 6):
+            data['set{}res1'.format(i)], data['set{}res2'.format(i)] = 11, i
+        response = self.assertWithinQueryBudget('/accounts/me/games/{}/'.format(game.pk), data, method='post')
+        self.assertEqual(response.status_code, 302)
+
+    def test_over_budget_is_logged(self):
+        create_tournament(8)
+        with override_settings(DEBUG=True), self.assertLogs('tournament.queries', 'INFO'):
+            response = self.client.get('/')
+        self.assertEqual(response['X-Query-Budget'], str(views.index.query_budget))
+        self.assertLessEqual(int(response['X-Query-Count']), views.index.query_budget)
+
+        with mock.patch.object(views.index, 'query_budget', 0), \
+                self.assertLogs('tournament.queries', 'WARNING') as logs:
+            self.client.get('/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['budget']), ('index', 0))
+        self.assertGreater(record['queries'], 0)
+
+
+class ProfilingTest(PublicPagesTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profile_dir = directory.name
+        profile_settings = override_settings(PROFILE_DIR=self.profile_dir, PROFILE_KEEP=2)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        create_tournament(8)
+
+    def test_server_timing(self):
+        timing = self.client.get('/rating/')['Server-Timing']
+        self.assertEqual([phase.split(';')[0] for phase in timing.split(', ')], ['db', 'template', 'view'])
+
+    def test_staff_profiles_are_kept_and_downloadable(self):
+        user = User.objects.create(username='visitor')
+        self.client.force_login(user)
+        self.assertNotIn('X-Profile', self.client.get('/rating/?profile=1'))
+
+        user.is_staff = user.is_superuser = True
+        user.save()
+        names = [self.client.get('/rating/', HTTP_X_PROFILE='1')['X-Profile'] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.profile_dir)), sorted(names[1:]))
+
+        self.assertContains(self.client.get('/admin/tournament/tournament/'), 'Request profiles')
+        response = self.client.get('/admin/tournament/tournament/profiles/')
+        self.assertContains(response, names[2])
+        self.assertNotContains(response, names[0])
+        response = self.client.get('/admin/tournament/tournament/profiles/' + names[2])
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="{}"'.format(names[2]))
+        self.assertContains(self.client.get('/admin/tournament/tournament/profiles/{}?stats'.format(names[2])),
+                            'cumulative')
+        self.assertEqual(self.client.get('/admin/tournament/tournament/profiles/' + names[0]).status_code, 404)
+        self.assertEqual(self.client.get('/admin/tournament/tournament/profiles/..prof').status_code, 404)
+
+
+class ExportScheduleTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.export_root = directory.name
+        export_settings = override_settings(EXPORT_ROOT=self.export_root)
+        export_settings.enable()
+        self.addCleanup(export_settings.disable)
+
+    def test_file_is_kept_until_the_schedule_changes(self):
+        tournament = create_tournament(8, played=0)
+        path = export_schedule(tournament)
+        with mock.patch('tournament.functions.write_schedule_to_xls') as write:
+            self.assertEqual(export_schedule(tournament), path)
+        write.assert_not_called()
+
+        game = tournament.game_set.filter(game_id=0).first()
+        SetResult(game=game, set_number=1, result1=11, result2=3).save()
+        changed = export_schedule(tournament)
+        self.assertNotEqual(changed, path)
+        self.assertEqual(os.listdir(self.export_root), [os.path.basename(changed)])
+
+    def test_play_off_sheet(self):
+        tournament = create_tournament(8, played=0)
+        book = load_workbook(export_schedule(tournament), read_only=True)
+        self.assertEqual(book.sheetnames, ['Расписание', 'Плей-офф'])
+        rows = [row for row in book['Плей-офф'].values if any(value is not None for value in row)]
+        # Two rows a game: the names of the players are in the third column
+        self.assertEqual(len(rows), 2 * tournament.game_set.exclude(game_id=0).count())
+        self.assertEqual(rows[0][2], "1 место на групповом этапе")
+        book.close()
+
+
+class StaticFilesTest(PublicPagesTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.static_root = directory.name
+        static_settings = override_settings(STATIC_ROOT=self.static_root)
+        static_settings.enable()
+        self.addCleanup(static_settings.disable)
+        create_tournament(8)
+
+    def test_collectstatic(self):
+        # No manifest before collectstatic: plain names
+        self.assertContains(self.client.get('/'), '/static/tournament/bootstrap.min.css')
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json'), encoding='utf-8') as f:
+            paths = json.load(f)['paths']
+        css = paths['tournament/bootstrap.min.css']
+        self.assertRegex(css, r'^tournament/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        self.assertContains(self.client.get('/'), '/static/' + css)
+
+        path = os.path.join(self.static_root, css)
+        with open(path, 'rb') as original, gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), original.read())
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, paths['tournament/door-exit.png']) + '.gz'))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'tournament/bootstrap.min.css.gz')))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConcurrentResultsTest(StandingsAssertions, TransactionTestCase):
+    def test_journal_mode(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    @mock.patch.object(transactions, 'LOCK_RETRY_DELAY', 0)
+    def test_retry_on_lock(self):
+        calls = []
+
+        @transactions.retry_on_lock
+        def write(error):
+            calls.append(error)
+            if len(calls) < 3:
+                raise OperationalError(error)
+            return len(calls)
+
+        with self.assertLogs('tournament.transactions', 'WARNING'):
+            self.assertEqual(write('database is locked'), 3)
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            write('no such table: tournament_game')
+        self.assertEqual(len(calls), 1)
+
+    def test_simultaneous_submissions(self):
+        tournament = create_tournament(24, played=0)
+        games = list(tournament.game_set.filter(game_id=0).select_related('participant1__user').order_by('pk')[:12])
+        data = {}
+        for i in range(1, 6):
+            data['set{}res1'.format(i)], data['set{}res2'.format(i)] = 11, i
+        barrier = threading.Barrier(len(games))
+        responses = {}
+
+        def submit(game):
+            try:
+                client = Client()
+                client.force_login(game.participant1.user)
+                barrier.wait()
+                responses[game.pk] = client.post('/accounts/me/games/{}/'.format(game.pk), data).status_code
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(game,)) for game in games]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(responses, {game.pk: 302 for game in games})
+        self.assertEqual(SetResult.objects.count(), 5 * len(games))
+        self.assertEqual(tournament.game_set.filter(is_played=True).count(), len(games))
+        self.assertEqual(ResultEvent.objects.values('game').distinct().count(), len(games))
+        self.assertStandingsMatchRecount(tournament)
+
+    def test_both_players_submit_at_once(self):
+        tournament = create_tournament(8, played=0)
+        game = tournament.game_set.filter(game_id=0).select_related('participant1__user', 'participant2__user').first()
+        barrier = threading.Barrier(2)
+        responses = []
+
+        def submit(user, result1, result2):
+            try:
+                client = Client()
+                client.force_login(user)
+                data = {}
+                for i in range(1, 6):
+                    data['set{}res1'.format(i)], data['set{}res2'.format(i)] = result1, result2
+                barrier.wait()
+                responses.append(client.post('/accounts/me/games/{}/'.format(game.pk), data).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(game.participant1.user, 11, 3)),
+                   threading.Thread(target=submit, args=(game.participant2.user, 3, 11))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(responses, [302, 302])
+        self.assertEqual(SetResult.objects.filter(game=game).count(), 5)
+        self.assertEqual(len({(r.result1, r.result2) for r in SetResult.objects.filter(game=game)}), 1)
+        self.assertStandingsMatchRecount(tournament)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsgiTest(TransactionTestCase):
+    """Requests through ping/asgi.py. Each test runs in one event loop, the one the application runs in."""
+
+    async def request(self, path, query_string=b''):
+        """Start a GET; returns the communicator and the response start message."""
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': path, 'query_string': query_string,
+            'headers': [], 'server': ('testserver', 80)})
+        await communicator.send_input({'type': 'http.request'})
+        return communicator, await communicator.receive_output(5)
+
+    async def read_body(self, communicator):
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body.decode()
+
+    def test_pages(self):
+        create_tournament(8)
+
+        async def get_pages():
+            for path in ('/',) + PublicPagesTestCase.pages:
+                communicator, start = await self.request(path)
+                self.assertEqual(start['status'], 200, path)
+                self.assertIn(b'Server-Timing', dict(start['headers']))
+                self.assertIn('</html>', await self.read_body(communicator))
+        async_to_sync(get_pages)()
+
+    @mock.patch.object(events, 'POLL_INTERVAL', 0.05)
+    @mock.patch.object(events, 'STREAM_DURATION', 0.5)
+    def test_result_events(self):
+        tournament = create_tournament(8, played=0)
+        after = last_event_id(tournament)
+        game = tournament.game_set.filter(game_id=0).first()
+        submit_results(tournament, game, [(11, 5)] * 5, '8f14e45f-ceea-467f-a8f5-8e7a5f3e9d0c')
+
+        async def stream():
+            communicator, start = await self.request('/events/', 'last_event_id={}'.format(after).encode())
+            self.assertEqual(dict(start['headers'])[b'Content-Type'], b'text/event-stream')
+            return await self.read_body(communicator)
+        body = async_to_sync(stream)()
+        self.assertEqual(body.count('event: result'), 1)
+        self.assertIn('"pk":{}'.format(game.pk), body)
+
+    @mock.patch.object(events, 'POLL_INTERVAL', 0.05)
+    @mock.patch.object(events, 'STREAM_DURATION', 1)
+    def test_streams_share_one_poller(self):
+        first = create_tournament(8, played=0)
+        second = create_tournament(8, played=0)
+        games = [tournament.game_set.filter(game_id=0).first() for tournament in (first, second)]
+        polls = mock.Mock(wraps=events.events_after)
+
+        async def stream(path):
+            communicator, start = await self.request(path)
+            self.assertEqual(start['status'], 200)
+            return await self.read_body(communicator)
+
+        async def submit():
+            # Both streams are open by now
+            await asyncio.sleep(0.3)
+            for tournament, game in zip((first, second), games):
+                await sync_to_async(submit_results)(tournament, game, [(11, 5)] * 5, str(uuid.uuid4()))
+
+        async def streams():
+            return await asyncio.gather(stream('/t/{}/events/'.format(first.pk)),
+                                        stream('/t/{}/events/'.format(second.pk)), submit())
+        with mock.patch.object(events, 'events_after', polls):
+            bodies = async_to_sync(streams)()[:2]
+        for body, game, other in zip(bodies, games, reversed(games)):
+            self.assertEqual(body.count('event: result'), 1)
+            self.assertIn('"pk":{}'.format(game.pk), body)
+            self.assertNotIn('"pk":{}'.format(other.pk), body)
+        # One poll a POLL_INTERVAL for both streams, not one each
+        self.assertLess(polls.call_count, 1 / 0.05 + 5)
+        self.assertTrue(events.hub.task.done())
+        self.assertEqual(events.hub.queues, {})
+
+    def test_stream_stops_when_the_client_disconnects(self):
+        create_tournament(8, played=0)
+
+        async def disconnect():
+            communicator, start = await self.request('/events/')
+            self.assertEqual(start['status'], 200)
+            self.assertTrue((await communicator.receive_output(5))['body'].startswith(b'retry:'))
+            await communicator.send_input({'type': 'http.disconnect'})
+            # Returns well before events.STREAM_DURATION
+            await communicator.wait(5)
+        async_to_sync(disconnect)()
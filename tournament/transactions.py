@@ -0,0 +1,33 @@
+import logging
+from functools import wraps
+from time import sleep
+from django.db import connection, OperationalError
+
+logger = logging.getLogger(__name__)
+
+LOCK_RETRIES = 3
+# Seconds before the first retry, doubled for each next one
+LOCK_RETRY_DELAY = 0.1
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_lock(func):
+    """
+    Run the function again when the database stays locked by other writers longer than its busy timeout.
+    The function must write in its own transactions: inside an outer transaction nothing is retried.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == LOCK_RETRIES or not is_lock_error(e) or connection.in_atomic_block:
+                    raise
+                logger.warning("%s: %s, retry %d of %d", func.__qualname__, e, attempt + 1, LOCK_RETRIES)
+                sleep(LOCK_RETRY_DELAY * 2 ** attempt)
+    return wrapper
@@ -1,19 +1,31 @@
-from django.urls import path
-from . import views
+from django.urls import path, include
+from . import views, api
 
-
-urlpatterns = [
+# Pages of a tournament: of the current one at the site root, of any tournament under /t/<tournament_id>/
+tournament_patterns = [
     path('', views.index, name='index'),
     path('participants/', views.participants, name='participants'),
     path('games/', views.games, name='games'),
+    path('games/schedule.xlsx', views.games_xls, name='games_xls'),
     path('rating/', views.rating, name='rating'),
     path('playoff/', views.playoff, name='playoff'),
+    path('events/', views.result_events, name='result_events'),
+    path('api/status/', api.status, name='api_status'),
+    path('api/schedule/', api.schedule, name='api_schedule'),
+    path('api/standings/', api.standings, name='api_standings'),
+    path('api/bracket/', api.bracket, name='api_bracket'),
+]
+
+urlpatterns = tournament_patterns + [
+    path('t/', views.tournaments, name='tournaments'),
+    path('t/<int:tournament_id>/', include((tournament_patterns, 'tournament'), namespace='t')),
     path('accounts/register/', views.account_register, name='account_register'),
     path('accounts/login/', views.account_login, name='account_login'),
     path('accounts/logout/', views.account_logout, name='account_logout'),
     path('accounts/me/', views.me, name='me'),
     path('accounts/me/register/', views.me_register, name='me_register'),
     path('accounts/me/before_draw/', views.me_before_draw, name='me_before_draw'),
+    path('accounts/me/draw_status/', views.me_draw_status, name='me_draw_status'),
     path('accounts/me/after_draw/', views.me_after_draw, name='me_after_draw'),
     path('accounts/me/games/', views.me_games, name='me_games'),
     path('accounts/me/games/<game>/', views.me_games, name='me_game'),
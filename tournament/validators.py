@@ -0,0 +1,46 @@
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+
+def validate_set(result1, result2):
+    """Check the score of one set: up to 11 points, with a difference of 2 points after 10:10."""
+    if result1 < 0 or result2 < 0:
+        raise ValidationError(_("Results cannot be negative"), code='negative')
+    if result1 == result2:
+        raise ValidationError(_("Results cannot be equal"), code='equal')
+    winner, loser = max(result1, result2), min(result1, result2)
+    if winner - loser == 1:
+        raise ValidationError(_("Point difference must be at least 2"), code='difference')
+    if winner - loser > 2 and winner != 11:
+        raise ValidationError(_("Result must be 11"), code='not_11')
+    if winner < 11:
+        raise ValidationError(_("Result must be at least 11"), code='less_than_11')
+
+
+def validate_game(sets, group_stage, number_of_sets, number_of_wins):
+    """
+    Check the scores of all sets of a game, a list of (result1, result2).
+    A group stage game has exactly `number_of_sets` sets; a play-off game lasts until `number_of_wins` won sets.
+    """
+    errors = []
+    for number, (result1, result2) in enumerate(sets, 1):
+        try:
+            validate_set(result1, result2)
+        except ValidationError as e:
+            errors.extend("Set #{}: {}".format(number, message) for message in e.messages)
+    if errors:
+        raise ValidationError(errors)
+
+    if group_stage:
+        if len(sets) != number_of_sets:
+            raise ValidationError(_("A group stage game has {} sets, not {}").format(number_of_sets, len(sets)))
+        return
+
+    wins1 = wins2 = 0
+    for number, (result1, result2) in enumerate(sets, 1):
+        if max(wins1, wins2) == number_of_wins:
+            raise ValidationError(_("Set #{}: the game is already won").format(number))
+        wins1 += result1 > result2
+        wins2 += result2 > result1
+    if max(wins1, wins2) != number_of_wins:
+        raise ValidationError(_("A play-off game lasts until {} won sets").format(number_of_wins))
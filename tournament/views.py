@@ -1,153 +1,187 @@
 # -*- coding: utf-8 -*-
 from datetime import *
-from django.http import HttpResponseRedirect, HttpResponse, Http404
-from django.shortcuts import render
-from .models import Tournament, Participant, SetResult, Game
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseRedirect, HttpResponse, Http404, JsonResponse, FileResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import render, get_object_or_404
+from .models import Tournament, Participant, SetResult
 from .forms import PlayoffResultForm, ResultForm, UserCreationForm
 from django.db import IntegrityError
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from tournament.functions import generate_games, generate_schedule, get_current_tournament, split_games_by_days,\
-    write_schedule_to_xls, generate_playoff_games, recount_rating
-
-
-def index(request):
-    status_msg = {
-        0: "Открыта регистрация на турнир",
-        1: "Регистрация на турнир завершена",
-        2: "Отборочный этап",
-        3: "Плей-офф",
-        4: "Турнир завершён.",
-        5: "Нет данных о турнирах",
-    }
-    tournament = get_current_tournament()
+from tournament.functions import split_games_by_days, export_schedule
+from tournament.jobs import enqueue_draw
+from tournament.caching import cached_page, get_data_version
+from tournament.asgi import AsyncStreamingHttpResponse, shared_thread
+from tournament.events import event_stream, async_event_stream, last_event_id
+from tournament.querystats import query_budget
+from tournament.transactions import retry_on_lock
+from tournament.results import submit_results
+
+
+status_msg = {
+    0: "Открыта регистрация на турнир",
+    1: "Регистрация на турнир завершена",
+    2: "Отборочный этап",
+    3: "Плей-офф",
+    4: "Турнир завершён.",
+    5: "Нет данных о турнирах",
+}
+
+# The public read views are async: under ASGI (ping/asgi.py) a request waiting for the database or the client
+# does not hold a worker thread. The ORM and the templates are sync and run through sync_to_async.
+render_async = sync_to_async(render)
+
+
+@query_budget(5)
+async def index(request):
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
         tournament_status = 5
     msg = status_msg[tournament_status]
-    return render(request, 'tournament/index.html', locals())
+    return await render_async(request, 'tournament/index.html', locals())
+
 
+@query_budget(6)
+def tournaments(request):
+    tournament = request.tournament
+    tournament_status = tournament.get_status() if tournament else 5
+    tournaments = [(t, status_msg[t.get_status()]) for t in Tournament.objects.order_by('-id')]
+    return render(request, 'tournament/tournaments.html', locals())
 
-def participants(request):
-    tournament = get_current_tournament()
+
+@query_budget(6)
+@cached_page
+async def participants(request):
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
         return HttpResponse("<h2>Participants list is not available</h2>")
-    if tournament_status in (0, 1, 2, 3):
-        return render(request, 'tournament/participants.html', locals())
+    if tournament_status in (0, 1, 2, 3, 4):
+        participants = tournament.participant_set.select_related('user').order_by('pk')
+        return await render_async(request, 'tournament/participants.html', locals())
     else:
         return HttpResponse("<h2>Participants list is not available</h2>")
 
 
-def games(request, game=None):
-    tournament = get_current_tournament()
+def with_results(games):
+    """Load the participants and the set results of the games along with them: 3 queries for any number of games."""
+    return games.select_related('participant1__user', 'participant2__user').prefetch_related(
+        Prefetch('setresult_set', queryset=SetResult.objects.order_by('set_number')))
+
+
+@query_budget(7)
+@cached_page
+async def games(request, game=None):
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
         return HttpResponse("<h2>Games list is not available</h2>")
-    games = list(tournament.game_set.filter(game_id=0).order_by('game_date', 'start_time'))
+    games = await sync_to_async(list)(with_results(tournament.game_set.filter(game_id=0)
+                                                  .order_by('game_date', 'start_time')))
     if games:
         days = split_games_by_days(games)
-    if tournament_status in (0, 1, 2, 3):
-        return render(request, 'tournament/games.html', locals())
+        data_version = await sync_to_async(get_data_version)(request)
+    if tournament_status in (0, 1, 2, 3, 4):
+        return await render_async(request, 'tournament/games.html', locals())
     else:
         return HttpResponse("<h2>Games list is not available</h2>")
 
 
-def rating(request):
-    tournament = get_current_tournament()
+@query_budget(4)
+@shared_thread
+async def result_events(request):
+    """
+    Server-Sent Events stream of result changes (see tournament.events).
+    Under ASGI the stream waits on the event loop for the one poller of the process (events.EventHub);
+    under WSGI it polls and holds a worker thread while it lasts.
+    """
+    tournament = request.tournament
+    if tournament is None:
+        # EventSource does not reconnect after 204 No Content
+        return HttpResponse(status=204)
+    after = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    try:
+        after = int(after)
+    except (TypeError, ValueError):
+        after = await sync_to_async(last_event_id)(tournament)
+    if isinstance(request, ASGIRequest):
+        response = AsyncStreamingHttpResponse(async_event_stream(tournament.pk, after),
+                                              content_type='text/event-stream')
+    else:
+        response = StreamingHttpResponse(event_stream(tournament.pk, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx must pass the events through as they come
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@query_budget(6)
+def games_xls(request):
+    tournament = request.tournament
+    if tournament is None or tournament.get_status() not in (1, 2, 3, 4) or not tournament.game_set.exists():
+        raise Http404
+    return schedule_xls_response(tournament)
+
+
+def schedule_xls_response(tournament):
+    return FileResponse(open(export_schedule(tournament), 'rb'), as_attachment=True, filename='schedule.xlsx')
+
+
+@query_budget(6)
+@cached_page
+async def rating(request):
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
         return HttpResponse("<h2>Rating is not available</h2>")
-    recount_rating()
 
-    participants = list(tournament.participant_set.all())
-    participants.sort(key=lambda elem: (elem.win_sets, elem.win_balls), reverse=True)
+    participants = tournament.standings()
 
-    if tournament_status in (0, 1, 2, 3):
-        return render(request, 'tournament/rating.html', locals())
+    if tournament_status in (0, 1, 2, 3, 4):
+        return await render_async(request, 'tournament/rating.html', locals())
     else:
         return HttpResponse("<h2>Participants rating is not available</h2>")
 
 
-def playoff(request):
-    tournament = get_current_tournament()
+@query_budget(7)
+@cached_page
+async def playoff(request):
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
         return HttpResponse("<h2>Play-off games are not available</h2>")
-    recount_rating()
-
-    participants = list(tournament.participant_set.all())
-    participants.sort(key=lambda elem: (elem.win_sets, elem.win_balls), reverse=True)
-    playoffs = participants[:8]
-
-    quarter_games = list(Game.objects.filter(Q(tournament=tournament) &
-                                             (Q(game_id=1) | Q(game_id=2) |
-                                              Q(game_id=3) | Q(game_id=4))))
-
-    for g in quarter_games:
-        g.participant1 = playoffs[g.id1 - 1]
-        g.participant2 = playoffs[g.id2 - 1]
-        g.save(first_call=False, update_fields=["participant1", "participant2"])
-
-    semi_games = list(Game.objects.filter(Q(tournament=tournament) &
-                                          (Q(game_id=5) | Q(game_id=6))))
-
-    for g in semi_games:
-        if type(g.get_p1()) is not Participant:
-            p1 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=g.id1)))[0].get_winner()
-            if p1:
-                g.participant1 = p1
-                g.save(first_call=False, update_fields=["participant1"])
-        if type(g.get_p2()) is not Participant:
-            p2 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=g.id2)))[0].get_winner()
-            if p2:
-                g.participant2 = p2
-                g.save(first_call=False, update_fields=["participant2"])
-
-    third_game = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=7)))
-    for g in third_game:
-        if type(g.get_p1()) is not Participant:
-            p1 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=5)))[0].get_loser()
-            if p1:
-                g.participant1 = p1
-                g.save(first_call=False, update_fields=["participant1"])
-        if type(g.get_p2()) is not Participant:
-            p2 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=6)))[0].get_loser()
-            if p2:
-                g.participant2 = p2
-                g.save(first_call=False, update_fields=["participant2"])
-
-    final_game = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=8)))
-    for g in final_game:
-        if type(g.get_p1()) is not Participant:
-            p1 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=5)))[0].get_winner()
-            if p1:
-                g.participant1 = p1
-                g.save(first_call=False, update_fields=["participant1"])
-        if type(g.get_p2()) is not Participant:
-            p2 = list(Game.objects.filter(Q(tournament=tournament) & Q(game_id=6)))[0].get_winner()
-            if p2:
-                g.participant2 = p2
-                g.save(first_call=False, update_fields=["participant2"])
-
-    if tournament_status in (0, 1, 2, 3):
-        return render(request, 'tournament/playoff.html', locals())
+
+    # Participants of play-off games are filled in when results are submitted (see tournament.bracket)
+    playoff_games = await sync_to_async(list)(with_results(tournament.game_set.filter(~Q(game_id=0))
+                                                          .order_by('game_id')))
+
+    quarter_games = [g for g in playoff_games if g.game_id in (1, 2, 3, 4)]
+    semi_games = [g for g in playoff_games if g.game_id in (5, 6)]
+    third_game = [g for g in playoff_games if g.game_id == 7]
+    final_game = [g for g in playoff_games if g.game_id == 8]
+
+    if tournament_status in (0, 1, 2, 3, 4):
+        return await render_async(request, 'tournament/playoff.html', locals())
     else:
         return HttpResponse("<h2>Play-off games are not available</h2>")
 
 
+@query_budget(10)
+@retry_on_lock
 def account_register(request):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -169,8 +203,9 @@ def account_register(request):
     return render(request, 'auth/account_register.html', locals())
 
 
+@query_budget(8)
 def account_login(request):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -192,14 +227,16 @@ def account_login(request):
     return render(request, 'auth/account_login.html', locals())
 
 
+@query_budget(4)
 def account_logout(request):
     logout(request)
     return HttpResponseRedirect('/')
 
 
+@query_budget(4)
 @login_required
 def me(request, game=None):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -226,9 +263,11 @@ def me(request, game=None):
     return render(request, 'tournament/index.html', locals())
 
 
+@query_budget(8)
 @login_required
+@retry_on_lock
 def me_register(request):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -250,9 +289,10 @@ def me_register(request):
     return HttpResponseRedirect('/accounts/me/')
 
 
+@query_budget(8)
 @login_required
 def me_before_draw(request):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -260,26 +300,44 @@ def me_before_draw(request):
 
     if tournament_status == 1:
         if request.user.username == "admin":
-            if tournament.game_set.all():
+            if tournament.game_set.exists():
                 return HttpResponseRedirect('/accounts/me/after_draw/')
         else:
             return HttpResponseRedirect('/accounts/me/games/')
 
         if request.method == 'POST':
-            schedule_ready = False
-            while not schedule_ready:
-                games = generate_games()
-                schedule_ready = generate_schedule(games)
-            generate_playoff_games()
+            # The draw is made by the run_draw_jobs worker
+            enqueue_draw(tournament)
             return HttpResponseRedirect('/accounts/me/before_draw/')
 
+        job = tournament.drawjob_set.order_by('-created').first()
         return render(request, 'auth/me_before_draw.html', locals())
     return HttpResponseRedirect('/accounts/me/')
 
 
+@query_budget(4)
+@login_required
+def me_draw_status(request):
+    tournament = request.tournament
+    if request.user.username != "admin" or tournament is None:
+        raise Http404
+    job = tournament.drawjob_set.order_by('-created').first()
+    if job is None:
+        return JsonResponse({'status': None})
+    return JsonResponse({
+        'status': job.get_status_display(),
+        'attempts': job.attempts,
+        'message': job.message,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+    })
+
+
+@query_budget(8)
 @login_required
 def me_after_draw(request):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -290,18 +348,17 @@ def me_after_draw(request):
             return HttpResponseRedirect('/accounts/me/games/')
 
         if request.method == 'POST':
-            games = tournament.game_set.filter(game_id=0).order_by('game_date', 'start_time')
-            days = split_games_by_days(games)
-            write_schedule_to_xls(days, tournament.number_of_sets)
-            return HttpResponseRedirect('/accounts/me/after_draw/')
+            return schedule_xls_response(tournament)
 
         return render(request, 'auth/me_after_draw.html', locals())
     return HttpResponseRedirect('/accounts/me/')
 
 
+@query_budget(25)
 @login_required
+@retry_on_lock
 def me_games(request, game=None):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -316,35 +373,33 @@ def me_games(request, game=None):
         if not p.drawn_number:
             return render(request, 'auth/me_games.html', locals())
 
-        games = tournament.game_set.filter(Q(game_id=0) &
-                                           (Q(participant1=p) | Q(participant2=p))).order_by('game_date', 'start_time')
+        games = with_results(tournament.game_set.filter(Q(game_id=0) & (Q(participant1=p) | Q(participant2=p)))
+                             .order_by('game_date', 'start_time'))
 
         for g in games:
             g.form = ResultForm()
 
         if request.method == 'POST':
-            game = Game.objects.get(pk=game)
+            game = get_object_or_404(tournament.game_set, pk=game)
             for g in games:
                 if g == game:
-                    if g.setresult_set.exists():
+                    if g.is_played:
                         return HttpResponseRedirect('/accounts/me/games/')
                     g.form = ResultForm(request.POST)
                     if g.form.is_valid():
-                        for i in range(1, 6):
-                            s = SetResult(game=game,
-                                          set_number=i,
-                                          result1=g.form.cleaned_data['set{}res1'.format(i)],
-                                          result2=g.form.cleaned_data['set{}res2'.format(i)])
-                            s.save()
+                        # The opponent may have submitted the game first: the page shows their result then
+                        submit_results(tournament, g, g.form.sets(), g.form.cleaned_data['submission'])
                         return HttpResponseRedirect('/accounts/me/games/')
                     break
         return render(request, 'auth/me_games.html', locals())
     return HttpResponseRedirect('/accounts/me/')
 
 
+@query_budget(30)
 @login_required
+@retry_on_lock
 def me_playoff_games(request, game=None):
-    tournament = get_current_tournament()
+    tournament = request.tournament
     if tournament:
         tournament_status = tournament.get_status()
     else:
@@ -356,28 +411,21 @@ def me_playoff_games(request, game=None):
         except ObjectDoesNotExist:
             return render(request, 'auth/me_playoff_games.html', locals())
 
-        games = tournament.game_set.filter(~Q(game_id=0) &
-                                           (Q(participant1=p) | Q(participant2=p))).order_by('game_date', 'start_time')
+        games = with_results(tournament.game_set.filter(~Q(game_id=0) & (Q(participant1=p) | Q(participant2=p)))
+                             .order_by('game_date', 'start_time'))
 
         for g in games:
             g.form = PlayoffResultForm()
 
         if request.method == 'POST':
-            game = Game.objects.get(pk=game)
+            game = get_object_or_404(tournament.game_set, pk=game)
             for g in games:
                 if g == game:
-                    if g.setresult_set.exists():
+                    if g.is_played:
                         return HttpResponseRedirect('/accounts/me/playoff_games/')
                     g.form = PlayoffResultForm(request.POST)
                     if g.form.is_valid():
-                        for i in range(1, 8):
-                            if g.form.cleaned_data['set{}res1'.format(i)] is None:
-                                break
-                            s = SetResult(game=game,
-                                          set_number=i,
-                                          result1=g.form.cleaned_data['set{}res1'.format(i)],
-                                          result2=g.form.cleaned_data['set{}res2'.format(i)])
-                            s.save()
+                        submit_results(tournament, g, g.form.sets(), g.form.cleaned_data['submission'])
                         return HttpResponseRedirect('/accounts/me/playoff_games/')
                     break
         return render(request, 'auth/me_playoff_games.html', locals())